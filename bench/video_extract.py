@@ -0,0 +1,177 @@
+"""Benchmark video frame extraction: peak memory and wall time per decode path.
+
+Compares the original list + np.stack + astype extraction ("legacy") with the
+FrameBuffer-based cv2 path and the ffmpeg pipe backend in nodes.py, each in a
+fresh process so peak RSS is not shared between runs.
+
+    python bench/video_extract.py clip.mp4
+    python bench/video_extract.py clip.mp4 --paths cv2 ffmpeg --repeat 3
+    python bench/video_extract.py --synth 1920x1080:10 --paths legacy cv2
+    python bench/video_extract.py clip.mp4 --paths cv2 ffmpeg --frame-step 4 --max-side 512
+
+--synth WxH:SECONDS renders a 30 fps test clip with ffmpeg instead of using a file.
+--frame-step, --target-fps and --max-side are forwarded to the cv2 and ffmpeg
+paths (ffmpeg applies them inside its decoder); legacy only supports --max-frames.
+Run it with the Python environment ComfyUI uses (torch, numpy, cv2 and/or ffmpeg).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ("legacy", "cv2", "ffmpeg")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def import_nodes():
+    """Import nodes.py outside a running ComfyUI. It registers aiohttp routes on
+    PromptServer.instance at import, so give it a throwaway route table and
+    folder_paths when ComfyUI's own are missing or not started."""
+    try:
+        import folder_paths  # noqa: F401
+    except ImportError:
+        folder_paths = types.ModuleType("folder_paths")
+        folder_paths.get_temp_directory = folder_paths.get_output_directory = \
+            folder_paths.get_input_directory = tempfile.gettempdir
+        sys.modules["folder_paths"] = folder_paths
+    try:
+        from server import PromptServer
+    except ImportError:
+        PromptServer = None
+    if PromptServer is None or getattr(PromptServer, "instance", None) is None:
+        class Routes:
+            def __getattr__(self, method):
+                return lambda *a, **k: (lambda handler: handler)
+        server = types.ModuleType("server")
+        server.PromptServer = types.SimpleNamespace(instance=types.SimpleNamespace(routes=Routes()))
+        sys.modules["server"] = server
+    sys.path.insert(0, ROOT)
+    import nodes
+    return nodes
+
+
+def legacy_extract(video_path, max_frames=0):
+    """extract_video_frames before the preallocated buffer: a list of RGB frames,
+    an np.stack copy and an astype copy, all alive at once."""
+    import cv2
+    import numpy as np
+    import torch
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {video_path}")
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if max_frames > 0 and len(frames) >= max_frames:
+            break
+    cap.release()
+    if not frames:
+        raise RuntimeError(f"No frames read from video: {video_path}")
+    stacked = np.stack(frames, axis=0).astype(np.float32) / 255.0
+    return torch.from_numpy(stacked)
+
+
+def run_one(path, clip, opts):
+    """Decode clip once with one path and print a JSON result line."""
+    nodes = import_nodes()
+    extract = {
+        "legacy": legacy_extract,
+        "cv2": nodes.extract_video_frames,
+        "ffmpeg": nodes.extract_video_frames_ffmpeg,
+    }[path]
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    frames = extract(clip, **opts)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "path": path,
+        "shape": list(frames.shape),
+        "output_mb": frames.numel() * frames.element_size() / 2**20,
+        "peak_mb": peak_rss_mb() - baseline,
+        "seconds": elapsed,
+    }))
+
+
+def synth_clip(spec, directory):
+    """Render a WxH:SECONDS 30 fps H.264 test clip with ffmpeg and return its path."""
+    size, _, seconds = spec.partition(":")
+    clip = os.path.join(directory, f"synth_{size}_{seconds or 10}s.mp4")
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30",
+         "-t", seconds or "10", "-pix_fmt", "yuv420p", clip],
+        check=True
+    )
+    return clip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("clip", nargs="?", help="video file to decode")
+    parser.add_argument("--synth", metavar="WxH:SECONDS", help="render a test clip with ffmpeg instead")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--max-frames", type=int, default=0)
+    parser.add_argument("--frame-step", type=int, default=1)
+    parser.add_argument("--target-fps", type=float, default=0.0)
+    parser.add_argument("--max-side", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per path; the fastest is reported")
+    parser.add_argument("--run", choices=PATHS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    opts = {"max_frames": args.max_frames}
+    decoder_opts = {"frame_step": args.frame_step, "target_fps": args.target_fps, "max_side": args.max_side}
+    decoder_opts = {k: v for k, v in decoder_opts.items() if v != parser.get_default(k)}
+    if args.run:
+        run_one(args.run, args.clip, dict(opts, **({} if args.run == "legacy" else decoder_opts)))
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = synth_clip(args.synth, tmp) if args.synth else args.clip
+        if not clip:
+            parser.error("give a clip or --synth")
+        print(f"{clip}  ({os.path.getsize(clip) / 2**20:.1f} MiB on disk)")
+        print(f"{'path':<8} {'frames':>7} {'output MiB':>11} {'peak MiB':>9} {'peak/out':>9} {'seconds':>8}")
+        for path in args.paths:
+            if path == "legacy" and decoder_opts:
+                print(f"{path:<8} skipped: supports --max-frames only")
+                continue
+            runs = []
+            for _ in range(args.repeat):
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), clip, "--run", path]
+                    + [f"--{k.replace('_', '-')}={v}" for k, v in dict(opts, **decoder_opts).items()],
+                    capture_output=True, text=True
+                )
+                if proc.returncode != 0:
+                    reason = (proc.stderr.strip().splitlines() or [f"exit status {proc.returncode}"])[-1]
+                    if proc.returncode == -9:
+                        reason += " (killed, likely out of memory)"
+                    print(f"{path:<8} failed: {reason}")
+                    break
+                runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            if not runs:
+                continue
+            best = min(runs, key=lambda r: r["seconds"])
+            peak = max(r["peak_mb"] for r in runs)
+            print(f"{path:<8} {best['shape'][0]:>7} {best['output_mb']:>11.0f} {peak:>9.0f} "
+                  f"{peak / best['output_mb']:>8.2f}x {best['seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,27 @@
+import asyncio
+import atexit
+import hashlib
 import json
+import math
+import os
 import shutil
+import subprocess
+import threading
+import time
+import uuid
+import zlib
 import base64
 import io
 import struct
 import numpy as np
 import torch
+import torch.nn.functional as F
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
-from PIL import Image, ImageDraw, PngImagePlugin
+from PIL import Image, ImageOps, PngImagePlugin
 import folder_paths
 from aiohttp import web
 from server import PromptServer
@@ -16,45 +31,1217 @@ try:
     HAS_CV2 = True
 except ImportError:
     HAS_CV2 = False
-    print("[Vewd] cv2 not available — video frame extraction disabled, will use screenshot fallback")
 
-# Store latest screenshot per node for IMAGE output (splat fallback)
-_screenshot_store = {}
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+HAS_FFMPEG = shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+HAS_VIDEO_DECODER = HAS_CV2 or HAS_FFMPEG
+
+if not HAS_CV2:
+    if HAS_FFMPEG:
+        print("[Vewd] cv2 not available — using ffmpeg for video frame extraction")
+    else:
+        print("[Vewd] cv2 and ffmpeg not available — video frame extraction disabled, will use screenshot fallback")
+
+VIDEO_BACKENDS = ["auto", "cv2", "ffmpeg"]
+
+def tensor_nbytes(value):
+    """Bytes held by a tensor or a tuple of tensors."""
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_nbytes(v) for v in value)
+    return value.element_size() * value.nelement()
+
+
+class DecodeCache:
+    """Process-wide LRU cache of decoded media tensors, bounded by total bytes.
+    Keys come from media_cache_key() so an edited or replaced file never hits a stale entry."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            tensor = self._entries.get(key)
+            if tensor is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tensor
+
+    def put(self, key, tensor):
+        size = tensor_nbytes(tensor)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= tensor_nbytes(old)
+            self._entries[key] = tensor
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= tensor_nbytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
 
-# Store active video file info per node for full-frame extraction
-_video_store = {}
+# Budget in MB, override with VEWD_DECODE_CACHE_MB (0 disables caching)
+_decode_cache = DecodeCache(int(os.environ.get("VEWD_DECODE_CACHE_MB", "2048")) * 1024 * 1024)
+
+
+class DiskCache:
+    """Size-bounded LRU of derived files under output/vewd-cache/ (peaks, waveforms,
+    MP3 transcodes, audio copies). Entries are named by the caller from content or
+    file-version keys; an index.json records sizes in LRU order so lookups are a
+    dict hit, and is rebuilt from a directory scan if missing. Changes mark the
+    index dirty; a timer thread writes it at most every SAVE_DELAY seconds, outside
+    the lock, so lookups never wait on a JSON dump."""
+
+    INDEX_NAME = "index.json"
+    SAVE_DELAY = 5.0
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._root = None
+        self._entries = None  # name -> {"size": int, "meta": dict}, oldest first
+        self._bytes = 0
+        self._dirty = False
+        self._save_timer = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one index write at a time, newest snapshot last
+
+    @property
+    def root(self):
+        if self._root is None:
+            self._root = Path(folder_paths.get_output_directory()) / "vewd-cache"
+        return self._root
+
+    def path(self, name):
+        """Where entry `name` lives on disk (nothing is checked)."""
+        return self.root / name
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        index_path = self.root / self.INDEX_NAME
+        try:
+            data = json.loads(index_path.read_text(encoding="utf-8"))
+            for name, size, meta in data.get("entries", []):
+                self._entries[name] = {"size": size, "meta": meta}
+        except (OSError, ValueError, TypeError):
+            # No usable index: adopt whatever is on disk, oldest first
+            found = []
+            if self.root.is_dir():
+                for f in self.root.rglob("*"):
+                    if f.is_file() and f.name != self.INDEX_NAME and not f.name.endswith(".tmp"):
+                        st = f.stat()
+                        found.append((st.st_mtime, f.relative_to(self.root).as_posix(), st.st_size))
+            for _, name, size in sorted(found):
+                self._entries[name] = {"size": size, "meta": {}}
+            if found:
+                self._mark_dirty()
+        self._bytes = sum(e["size"] for e in self._entries.values())
+
+    def _mark_dirty(self):
+        """Flag the index as changed and schedule a flush. Call with _lock held."""
+        self._dirty = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.SAVE_DELAY, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write index.json if it changed. Only the snapshot is taken under _lock;
+        serializing and writing happen outside it."""
+        with self._save_lock:
+            with self._lock:
+                self._save_timer = None
+                if not self._dirty or self._entries is None:
+                    return
+                entries = [[name, e["size"], e["meta"]] for name, e in self._entries.items()]
+                self._dirty = False
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.root / f"{self.INDEX_NAME}.{uuid.uuid4().hex}.tmp"
+                tmp_path.write_text(json.dumps({"version": 1, "entries": entries}), encoding="utf-8")
+                os.replace(tmp_path, self.root / self.INDEX_NAME)
+            except OSError as e:
+                print(f"[Vewd] Cache index save failed: {e}")
+                with self._lock:
+                    self._dirty = True  # retried with the next change
+
+    def _evict(self, keep):
+        while self._bytes > self.max_bytes:
+            victim = next((name for name in self._entries if name != keep), None)
+            if victim is None:
+                break
+            self._bytes -= self._entries.pop(victim)["size"]
+            self.path(victim).unlink(missing_ok=True)
+            self.evictions += 1
+
+    def get(self, name):
+        """Path of a cached entry, marked most recently used, or None."""
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            self._mark_dirty()
+            return self.path(name)
+
+    def meta(self, name):
+        with self._lock:
+            self._load()
+            entry = self._entries.get(name)
+            return entry["meta"] if entry else None
+
+    def add(self, name, meta=None):
+        """Record a file the caller has already placed at path(name), then evict to fit."""
+        size = self.path(name).stat().st_size
+        with self._lock:
+            self._load()
+            old = self._entries.pop(name, None)
+            if old is not None:
+                self._bytes -= old["size"]
+            self._entries[name] = {"size": size, "meta": meta or {}}
+            self._bytes += size
+            self._evict(keep=name)
+            self._mark_dirty()
+        return self.path(name)
+
+    def put_bytes(self, name, data, meta=None):
+        """Write data atomically as entry `name` and record it."""
+        dst = self.path(name)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dst.with_name(f"{dst.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, dst)
+        return self.add(name, meta)
+
+    def discard(self, name):
+        """Drop an entry, e.g. when its file turned out to be missing."""
+        with self._lock:
+            self._load()
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self._bytes -= entry["size"]
+                self._mark_dirty()
+        self.path(name).unlink(missing_ok=True)
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Budget in MB for output/vewd-cache/, override with VEWD_DISK_CACHE_MB
+_disk_cache = DiskCache(int(os.environ.get("VEWD_DISK_CACHE_MB", "2048")) * 1024 * 1024)
+atexit.register(_disk_cache.flush)
+
+
+class NodeSession:
+    """Viewer state for one Vewd node: the active selection (batch items, or a video
+    or image with its resolved path), the screenshot decoded on upload, the load
+    options from the node's last run and its background pre-decodes.
+    version is bumped on every selection change."""
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.batch = None       # list of batch items
+        self.video = None       # {"filename", "subfolder", "type", "path"}
+        self.image = None       # {"filename", "subfolder", "type", "path"}
+        self.screenshot = None  # IMAGE tensor
+        self.screenshot_at = 0.0
+        self.load_opts = None
+        self.predecodes = {}    # kind -> (signature, Future)
+        self.version = 0
+        self.touched = time.monotonic()
+
+    @property
+    def kind(self):
+        """Media kind process() will output, in its priority order."""
+        for kind in ("batch", "video", "image", "screenshot"):
+            if getattr(self, kind) is not None:
+                return kind
+        return None
+
+    def nbytes(self):
+        """Tensor memory held: the screenshot plus finished pre-decode results."""
+        size = tensor_nbytes(self.screenshot) if self.screenshot is not None else 0
+        for _, future in self.predecodes.values():
+            if future.done() and not future.cancelled() and future.exception() is None:
+                result = future.result()
+                if result is not None:
+                    size += tensor_nbytes(result)
+        return size
+
+    def cancel_predecodes(self):
+        for _, future in self.predecodes.values():
+            future.cancel()
+        self.predecodes.clear()
+
+
+class SessionStore:
+    """Thread-safe NodeSession per node id. aiohttp handlers edit sessions while
+    Vewd.process reads them from the executor thread. Sessions idle for longer than
+    ttl expire; beyond max_sessions or max_bytes of held tensors the least recently
+    used sessions are evicted (cancelling their pre-decodes)."""
+
+    def __init__(self, max_bytes, ttl, max_sessions=256):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.evictions = 0
+        self.expirations = 0
+        self._sessions = OrderedDict()  # node_id -> NodeSession, least recently used first
+        self._lock = threading.RLock()
+
+    def _drop(self, node_id):
+        self._sessions.pop(node_id).cancel_predecodes()
+
+    def _trim(self, keep=None):
+        cutoff = time.monotonic() - self.ttl
+        for node_id in [n for n, sess in self._sessions.items() if sess.touched < cutoff and n != keep]:
+            self._drop(node_id)
+            self.expirations += 1
+        total = sum(sess.nbytes() for sess in self._sessions.values())
+        while len(self._sessions) > self.max_sessions or total > self.max_bytes:
+            victim = next((n for n in self._sessions if n != keep), None)
+            if victim is None:
+                break
+            total -= self._sessions[victim].nbytes()
+            self._drop(victim)
+            self.evictions += 1
+
+    def _use(self, node_id, create=False):
+        session = self._sessions.get(node_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[node_id] = NodeSession(node_id)
+        self._sessions.move_to_end(node_id)
+        session.touched = time.monotonic()
+        return session
+
+    @contextmanager
+    def locked(self):
+        """Hold the store lock across several edit() calls so they apply together."""
+        with self._lock:
+            yield
+
+    @contextmanager
+    def edit(self, node_id):
+        """Hold the lock and yield node_id's session (created if needed). On exit the
+        version is bumped and expired or over-budget sessions are evicted."""
+        with self._lock:
+            session = self._use(node_id, create=True)
+            try:
+                yield session
+            finally:
+                session.version += 1
+                self._trim(keep=node_id)
+
+    def snapshot(self, node_id):
+        """Copy of a session's selection for process(), or None if there is none."""
+        with self._lock:
+            self._trim()
+            session = self._use(node_id)
+            if session is None:
+                return None
+            return {
+                "version": session.version,
+                "batch": session.batch,
+                "video": session.video,
+                "image": session.image,
+                "screenshot": session.screenshot,
+            }
+
+    def set_load_opts(self, node_id, load_opts):
+        """Remember a node's load options so its next selection pre-decodes with them."""
+        with self._lock:
+            self._use(node_id, create=True).load_opts = load_opts
+
+    def pop_predecode(self, node_id, kind):
+        with self._lock:
+            session = self._sessions.get(node_id)
+            return session.predecodes.pop(kind, None) if session else None
+
+    def finish_run(self, node_id, version):
+        """After process(): drop the consumed batch and cancel or release any
+        pre-decodes, unless the selection changed since `version` (a newer sync's
+        pre-decode is then kept for the next run)."""
+        with self._lock:
+            session = self._sessions.get(node_id)
+            if session is not None and session.version == version:
+                session.batch = None
+                session.cancel_predecodes()
+                session.version += 1
+
+    def latest_screenshot(self):
+        """Most recently uploaded screenshot from any node."""
+        with self._lock:
+            self._trim()
+            uploaded = [sess for sess in self._sessions.values() if sess.screenshot is not None]
+            return max(uploaded, key=lambda sess: sess.screenshot_at).screenshot if uploaded else None
+
+    def stats(self):
+        with self._lock:
+            kinds = {}
+            for sess in self._sessions.values():
+                kinds[sess.kind or "empty"] = kinds.get(sess.kind or "empty", 0) + 1
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "bytes": sum(sess.nbytes() for sess in self._sessions.values()),
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "kinds": kinds,
+                "predecodes_pending": sum(1 for sess in self._sessions.values()
+                                          for _, future in sess.predecodes.values() if not future.done()),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
 
-# Store active image file info per node for direct-from-disk loading
-_image_store = {}
 
-# Store batch of selected media items per node for multi-frame output
-_batch_store = {}
+# Per-node viewer state. Tensor budget in MB via VEWD_SESSION_STORE_MB; idle sessions expire after a day.
+_sessions = SessionStore(int(os.environ.get("VEWD_SESSION_STORE_MB", "1024")) * 1024 * 1024, 24 * 3600)
+MAX_SCREENSHOT_BYTES = 64 * 1024 * 1024
 
 
-def extract_video_frames(video_path, max_frames=0):
-    """Read all frames from a video file and return as (N, H, W, 3) float32 tensor."""
+def decode_screenshot(data):
+    """Encoded screenshot bytes to a (1, H, W, 3) float IMAGE tensor."""
+    img = Image.open(io.BytesIO(data)).convert("RGB")
+    return torch.from_numpy(np.asarray(img, dtype=np.float32) / 255.0).unsqueeze(0)
+
+
+def resolve_media_path(source_type, subfolder, filename):
+    """Resolve a ComfyUI (type, subfolder, filename) triple to a path on disk.
+    Raises ValueError if subfolder/filename escape the type's directory, the same
+    containment check ComfyUI's /view applies."""
+    type_dirs = {
+        "temp": folder_paths.get_temp_directory(),
+        "output": folder_paths.get_output_directory(),
+        "input": folder_paths.get_input_directory(),
+    }
+    base_dir = os.path.abspath(type_dirs.get(source_type, folder_paths.get_temp_directory()))
+    path = os.path.abspath(os.path.join(base_dir, subfolder or "", filename))
+    if os.path.commonpath((path, base_dir)) != base_dir:
+        raise ValueError(f"Path outside the {source_type} directory: {os.path.join(subfolder or '', filename)}")
+    return Path(path)
+
+
+def media_cache_key(path, *params):
+    """Cache key for a decoded file: resolved path, mtime, size and decode parameters."""
+    try:
+        resolved = Path(path).resolve()
+        st = resolved.stat()
+    except OSError:
+        return None
+    return (str(resolved), st.st_mtime_ns, st.st_size) + params
+
+
+def cached_decode(path, params, decode):
+    """Return decode() for path, served from the decode cache when the file is unchanged."""
+    key = media_cache_key(path, *params)
+    if key is not None:
+        tensor = _decode_cache.get(key)
+        if tensor is not None:
+            return tensor
+    tensor = decode()
+    if key is not None:
+        _decode_cache.put(key, tensor)
+    return tensor
+
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif')
+
+# PIL decode releases the GIL, so batch images decode in parallel on a small pool
+_decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4), thread_name_prefix="vewd-decode")
+
+
+def image_has_alpha(img):
+    """True if an opened PIL image carries an alpha channel or transparency."""
+    return img.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in img.info
+
+
+def probe_image(img_path):
+    """Return (width, height, has_alpha, n_frames) without decoding pixels.
+    n_frames is above 1 for animated GIF, WebP and APNG sources."""
+    with Image.open(img_path) as img:
+        return img.size[0], img.size[1], image_has_alpha(img), getattr(img, "n_frames", 1)
+
+
+def empty_mask(frames):
+    """Placeholder MASK for media without alpha, shaped like LoadImage's."""
+    return torch.zeros((frames, 64, 64), dtype=torch.float32)
+
+
+def resized_as(img, size, mode):
+    """Return img at size in mode ("RGB" or "RGBA"). Shrinks before converting, so
+    convert() only copies the small image. Palette, 16-bit and keyed-transparency
+    sources, and alpha sources whose alpha is dropped, convert first: resampling
+    them directly would change their pixels."""
+    if (img.mode not in ("RGB", "RGBA", "L", "LA") or "transparency" in img.info
+            or (mode == "RGB" and img.mode in ("RGBA", "LA"))):
+        img = img.convert(mode)
+    if img.size != size:
+        img = img.resize(size, Image.LANCZOS, reducing_gap=2.0)
+    return img if img.mode == mode else img.convert(mode)
+
+
+def decode_image_into(img_path, dst, mask_dst=None):
+    """Decode an image and write it into dst, an (H, W, 3) array, and optionally
+    its inverted alpha into mask_dst, an (H, W) array, from the same decode.
+    float32 destinations are normalized to 0-1; uint8 destinations get raw pixels.
+    When dst is smaller than the source, JPEGs decode at reduced scale via draft()
+    and other formats shrink through reduce() before the final resample and the
+    mode conversion (resized_as), so the full-resolution image exists only once,
+    and never as float32."""
+    size = (dst.shape[1], dst.shape[0])
+    with Image.open(img_path) as img:
+        if img.size != size and img.format == "JPEG":
+            img.draft("RGB", size)
+        with_alpha = mask_dst is not None and image_has_alpha(img)
+        pixels = np.asarray(resized_as(img, size, "RGBA" if with_alpha else "RGB"))
+        if dst.dtype == np.uint8:
+            np.copyto(dst, pixels[..., :3])
+        else:
+            np.multiply(pixels[..., :3], 1.0 / 255.0, out=dst, dtype=np.float32)
+        if mask_dst is None:
+            return
+        if not with_alpha:
+            mask_dst.fill(0)
+        elif mask_dst.dtype == np.uint8:
+            np.subtract(255, pixels[..., 3], out=mask_dst)
+        else:
+            # LoadImage convention: mask = 1 - alpha
+            np.multiply(pixels[..., 3], 1.0 / 255.0, out=mask_dst, dtype=np.float32)
+            np.subtract(1.0, mask_dst, out=mask_dst)
+
+
+def load_image_tensor(img_path, max_side=0, max_megapixels=0.0):
+    """Load an image file as (IMAGE, MASK) tensors via the decode cache, downscaled
+    to fit max_side / max_megapixels (0 = no limit). Both come from one decode."""
+    def decode():
+        width, height, has_alpha, _ = probe_image(img_path)
+        width, height = scaled_size(width, height, max_side, max_megapixels)
+        out = torch.empty((1, height, width, 3), dtype=torch.float32)
+        if not has_alpha:
+            decode_image_into(img_path, out.numpy()[0])
+            return out, empty_mask(1)
+        mask = torch.empty((1, height, width), dtype=torch.float32)
+        decode_image_into(img_path, out.numpy()[0], mask.numpy()[0])
+        return out, mask
+    return cached_decode(img_path, ("image", max_side, max_megapixels), decode)
+
+
+def palette_lut(img):
+    """Lookup tables mapping palette indices straight to normalized RGB and to mask values."""
+    rgb = np.zeros((256, 3), dtype=np.float32)
+    entries = np.asarray(img.getpalette() or [], dtype=np.float32).reshape(-1, 3)[:256]
+    rgb[:len(entries)] = entries / 255.0
+    mask = np.zeros(256, dtype=np.float32)
+    transparency = img.info.get("transparency")
+    if isinstance(transparency, int) and transparency < 256:
+        mask[transparency] = 1.0
+    return rgb, mask
+
+
+def animation_indices(img, max_frames=0, start_frame=0, start_time=0.0, frame_step=1, target_fps=0.0, **_):
+    """Frame indices of an opened animated image that extract_animated_frames keeps."""
+    total = getattr(img, "n_frames", 1)
+    fps = 1000.0 / (img.info.get("duration") or 100)
+    start_frame, stride = frame_plan(fps, start_frame, start_time, frame_step, target_fps)
+    indices = []
+    pos = float(start_frame)
+    while pos < total and (max_frames <= 0 or len(indices) < max_frames):
+        indices.append(int(pos))
+        pos += stride
+    return indices
+
+
+def extract_animated_frames(img_path, max_frames=0, start_frame=0, start_time=0.0, frame_step=1,
+                            target_fps=0.0, max_side=0, max_megapixels=0.0, out=None, mask_out=None, **_):
+    """Decode an animated GIF/WebP/APNG into (IMAGE, MASK) frame batches, with the
+    same range/stride/size semantics as extract_video_frames. The output is
+    preallocated from n_frames, or written into out / mask_out (rows of a larger
+    batch) when they have the right shape. Palette frames at output size are converted
+    with a per-palette lookup table built once, instead of a convert() per frame."""
+    with Image.open(img_path) as img:
+        indices = animation_indices(img, max_frames, start_frame, start_time, frame_step, target_fps)
+        if not indices:
+            raise RuntimeError(f"No frames read from animation: {img_path}")
+
+        width, height = scaled_size(img.size[0], img.size[1], max_side, max_megapixels)
+        has_alpha = image_has_alpha(img)
+        if out is None or tuple(out.shape[:3]) != (len(indices), height, width):
+            out = torch.empty((len(indices), height, width, 3), dtype=torch.float32)
+            mask_out = None
+        out_np = out.numpy()
+        mask = None
+        if has_alpha:
+            mask = mask_out if mask_out is not None else torch.empty((len(indices), height, width), dtype=torch.float32)
+        mask_np = mask.numpy() if has_alpha else None
+        luts = {}
+        for slot, index in enumerate(indices):
+            img.seek(index)
+            if img.mode == "P" and img.size == (width, height):
+                key = (bytes(img.getpalette() or []), img.info.get("transparency"))
+                if key not in luts:
+                    luts[key] = palette_lut(img)
+                rgb_lut, mask_lut = luts[key]
+                pixels = np.asarray(img)
+                np.take(rgb_lut, pixels, axis=0, out=out_np[slot])
+                if has_alpha:
+                    np.take(mask_lut, pixels, axis=0, out=mask_np[slot])
+                continue
+            pixels = np.asarray(resized_as(img, (width, height), "RGBA" if has_alpha else "RGB"))
+            np.multiply(pixels[..., :3], 1.0 / 255.0, out=out_np[slot], dtype=np.float32)
+            if has_alpha:
+                np.multiply(pixels[..., 3], 1.0 / 255.0, out=mask_np[slot], dtype=np.float32)
+                np.subtract(1.0, mask_np[slot], out=mask_np[slot])
+
+    return out, mask if has_alpha else empty_mask(len(indices))
+
+
+def load_animated_tensor(img_path, **decode_opts):
+    """Decode an animated image to (IMAGE, MASK) frame batches via the decode cache."""
+    params = ("animated",) + tuple(sorted(decode_opts.items()))
+    return cached_decode(img_path, params, lambda: extract_animated_frames(img_path, **decode_opts))
+
+
+def load_video_tensor(video_path, **decode_opts):
+    """Extract video frames as an (N, H, W, 3) float32 tensor via the decode cache.
+    decode_opts are the extract_video range/stride/size/backend keyword arguments."""
+    params = ("video",) + tuple(sorted(decode_opts.items()))
+    return cached_decode(video_path, params, lambda: extract_video(video_path, **decode_opts))
+
+
+class FrameBuffer:
+    """Growable (N, H, W, 3) float32 frame buffer filled one slot at a time.
+    Sized up front when the frame count is known; otherwise grows in chunks,
+    which costs a single concat at the end instead of a per-frame list.
+    head, when its frame size matches, is used as the first chunk so frames land
+    directly in caller-owned storage (rows of a batch tensor)."""
+
+    CHUNK = 64
+
+    def __init__(self, height, width, expected=0, head=None):
+        self.height = height
+        self.width = width
+        self.count = 0
+        self._chunks = []
+        self._capacity = 0
+        if head is not None and head.shape[0] > 0 and tuple(head.shape[1:3]) == (height, width):
+            self._grow(head.shape[0], head)
+        else:
+            self._grow(expected if expected > 0 else self.CHUNK)
+
+    def _grow(self, frames, chunk=None):
+        if chunk is None:
+            chunk = torch.empty((frames, self.height, self.width, 3), dtype=torch.float32)
+        self._chunks.append((chunk, chunk.numpy()))
+        self._capacity += frames
+
+    def next_slot(self):
+        """Return the (H, W, 3) float32 array the next frame should be written into."""
+        if self.count == self._capacity:
+            self._grow(self.CHUNK)
+        chunk, chunk_np = self._chunks[-1]
+        index = self.count - (self._capacity - chunk.shape[0])
+        self.count += 1
+        return chunk_np[index]
+
+    def finish(self):
+        """Return the filled frames as one tensor."""
+        if len(self._chunks) == 1:
+            return self._chunks[0][0][:self.count]
+        used = []
+        remaining = self.count
+        for chunk, _ in self._chunks:
+            take = min(remaining, chunk.shape[0])
+            if take:
+                used.append(chunk[:take])
+            remaining -= take
+        self._chunks = []
+        return torch.cat(used, dim=0)
+
+
+def scaled_size(width, height, max_side=0, max_megapixels=0.0):
+    """Return (width, height) shrunk to fit max_side and max_megapixels, keeping aspect (0 = no limit)."""
+    scale = 1.0
+    if max_side > 0 and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+    if max_megapixels > 0 and width * height * scale * scale > max_megapixels * 1e6:
+        scale = math.sqrt(max_megapixels * 1e6 / (width * height))
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def frame_plan(fps, start_frame=0, start_time=0.0, frame_step=1, target_fps=0.0):
+    """Return (start_frame, stride): start_time overrides start_frame when fps is known,
+    and stride is the source frames advanced per kept frame (fractional when
+    resampling to target_fps)."""
+    if start_time > 0 and fps > 0:
+        start_frame = int(round(start_time * fps))
+    if target_fps > 0 and fps > target_fps:
+        return start_frame, fps / target_fps
+    return start_frame, float(max(1, frame_step))
+
+
+def expected_frames(total, start_frame, stride, max_frames=0):
+    """Frames a decode keeps from a source of total frames (0 = unknown)."""
+    expected = 0
+    if total > start_frame:
+        expected = int(math.ceil((total - start_frame) / stride))
+    if max_frames > 0 and expected > 0:
+        expected = min(expected, max_frames)
+    return expected
+
+
+def extract_video_frames(video_path, max_frames=0, start_frame=0, start_time=0.0,
+                         frame_step=1, target_fps=0.0, max_side=0, max_megapixels=0.0, out=None):
+    """Read frames from a video file and return as (N, H, W, 3) float32 tensor.
+    Seeks to start_frame (or start_time seconds), keeps every frame_step-th frame
+    (or resamples to target_fps) and skips the rest with grab() so they are never
+    converted. Frames are downscaled to max_side / max_megapixels as uint8 and converted one at a time
+    into a preallocated buffer, so peak memory is about one output tensor plus a frame.
+    out, an optional (n, H, W, 3) float32 tensor, receives the first n frames when the
+    output size matches (see FrameBuffer's head)."""
     cap = cv2.VideoCapture(str(video_path))
     if not cap.isOpened():
         raise RuntimeError(f"Cannot open video: {video_path}")
 
-    frames = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        # BGR -> RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        frames.append(frame_rgb)
-        if max_frames > 0 and len(frames) >= max_frames:
-            break
-    cap.release()
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        start_frame, stride = frame_plan(fps, start_frame, start_time, frame_step, target_fps)
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        expected = expected_frames(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), start_frame, stride, max_frames)
+
+        buffer = None
+        bgr = None
+        rgb = None
+        small = None
+        out_size = None
+        index = 0
+        next_keep = 0.0
+        while True:
+            if index < next_keep:
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ret, bgr = cap.read(bgr)
+            if not ret:
+                break
+            index += 1
+            next_keep += stride
+            if buffer is None:
+                height, width = bgr.shape[:2]
+                out_size = scaled_size(width, height, max_side, max_megapixels)
+                buffer = FrameBuffer(out_size[1], out_size[0], expected, out)
+                rgb = np.empty_like(bgr)
+                if out_size != (width, height):
+                    small = np.empty((out_size[1], out_size[0], 3), dtype=np.uint8)
+            # BGR -> RGB into a reused scratch frame, then normalize into the output slot
+            cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=rgb)
+            src = rgb
+            if small is not None:
+                cv2.resize(rgb, out_size, dst=small, interpolation=cv2.INTER_AREA)
+                src = small
+            np.multiply(src, 1.0 / 255.0, out=buffer.next_slot(), dtype=np.float32)
+            if max_frames > 0 and buffer.count >= max_frames:
+                break
+    finally:
+        cap.release()
+
+    if buffer is None or buffer.count == 0:
+        raise RuntimeError(f"No frames read from video: {video_path}")
 
-    if not frames:
+    return buffer.finish()
+
+
+def probe_video(video_path):
+    """Return (width, height, fps, frame_count) of the first video stream via ffprobe.
+    frame_count is 0 when the container does not record it and duration is unknown."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height,r_frame_rate,nb_frames:format=duration",
+         "-of", "json", str(video_path)],
+        capture_output=True, timeout=15
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {result.stderr.decode()[:200]}")
+    info = json.loads(result.stdout)
+    if not info.get("streams"):
+        raise RuntimeError(f"No video stream in: {video_path}")
+    stream = info["streams"][0]
+    num, _, den = stream.get("r_frame_rate", "0/1").partition("/")
+    try:
+        fps = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        fps = 0.0
+    try:
+        frame_count = int(stream.get("nb_frames", 0))
+    except ValueError:
+        frame_count = 0
+    if not frame_count and fps:
+        try:
+            frame_count = int(float(info.get("format", {}).get("duration", 0)) * fps)
+        except ValueError:
+            frame_count = 0
+    return int(stream["width"]), int(stream["height"]), fps, frame_count
+
+
+def _read_exact(stream, buf):
+    """Fill buf completely from a binary stream. Returns False on EOF."""
+    view = memoryview(buf).cast("B")
+    got = 0
+    while got < len(view):
+        n = stream.readinto(view[got:])
+        if not n:
+            return False
+        got += n
+    return True
+
+
+def extract_video_frames_ffmpeg(video_path, max_frames=0, start_frame=0, start_time=0.0,
+                                frame_step=1, target_fps=0.0, max_side=0, max_megapixels=0.0, out=None):
+    """ffmpeg counterpart of extract_video_frames, for installs without OpenCV.
+    Seeking, striding and scaling run inside ffmpeg's multi-threaded decoder and
+    rgb24 frames are streamed from its stdout straight into a preallocated buffer
+    (or into out, as in extract_video_frames)."""
+    width, height, fps, total = probe_video(video_path)
+    if start_time <= 0 and start_frame > 0 and fps > 0:
+        start_time = start_frame / fps
+    start_frame, stride = frame_plan(fps, start_frame, start_time, frame_step, target_fps)
+
+    filters = []
+    if target_fps > 0 and fps > target_fps:
+        filters.append(f"fps={target_fps}")
+    elif frame_step > 1:
+        filters.append(f"select=not(mod(n\\,{frame_step}))")
+    out_w, out_h = scaled_size(width, height, max_side, max_megapixels)
+    if (out_w, out_h) != (width, height):
+        filters.append(f"scale={out_w}:{out_h}:flags=area")
+
+    cmd = ["ffmpeg", "-v", "error", "-nostdin", "-threads", "0", "-noautorotate"]
+    if start_time > 0:
+        cmd += ["-ss", f"{start_time:.6f}"]
+    cmd += ["-i", str(video_path)]
+    if filters:
+        cmd += ["-vf", ",".join(filters), "-vsync", "0"]
+    if max_frames > 0:
+        cmd += ["-frames:v", str(max_frames)]
+    cmd += ["-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+
+    buffer = FrameBuffer(out_h, out_w, expected_frames(total, start_frame, stride, max_frames), out)
+    rgb = np.empty((out_h, out_w, 3), dtype=np.uint8)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while _read_exact(proc.stdout, rgb):
+            np.multiply(rgb, 1.0 / 255.0, out=buffer.next_slot(), dtype=np.float32)
+            if max_frames > 0 and buffer.count >= max_frames:
+                break
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+    if buffer.count == 0:
         raise RuntimeError(f"No frames read from video: {video_path}")
 
-    # Stack to (N, H, W, 3) float32 normalized
-    stacked = np.stack(frames, axis=0).astype(np.float32) / 255.0
-    return torch.from_numpy(stacked)
+    return buffer.finish()
+
+
+def video_backend(backend="auto"):
+    """Resolve a video_backend input to "cv2" or "ffmpeg".
+    auto prefers cv2 and falls back to ffmpeg when OpenCV is not installed."""
+    if backend == "cv2" and not HAS_CV2:
+        raise RuntimeError("cv2 video backend requested but OpenCV is not installed")
+    if backend == "ffmpeg" or (backend == "auto" and not HAS_CV2):
+        if not HAS_FFMPEG:
+            raise RuntimeError("ffmpeg video backend requested but ffmpeg/ffprobe were not found")
+        return "ffmpeg"
+    return "cv2"
+
+
+def extract_video(video_path, backend="auto", **opts):
+    """Dispatch frame extraction to the cv2 or ffmpeg backend (see video_backend)."""
+    if video_backend(backend) == "ffmpeg":
+        return extract_video_frames_ffmpeg(video_path, **opts)
+    return extract_video_frames(video_path, **opts)
+
+
+def probe_video_output(video_path, backend="auto", max_frames=0, start_frame=0, start_time=0.0,
+                       frame_step=1, target_fps=0.0, max_side=0, max_megapixels=0.0):
+    """Predict extract_video's output as (width, height, frames) from container
+    metadata, without decoding: CAP_PROP_FRAME_COUNT for cv2, ffprobe for ffmpeg.
+    frames is 0 when the container records no count, and may be off by a few
+    frames for variable frame rate sources."""
+    if video_backend(backend) == "ffmpeg":
+        width, height, fps, total = probe_video(video_path)
+    else:
+        cap = cv2.VideoCapture(str(video_path))
+        try:
+            if not cap.isOpened():
+                raise RuntimeError(f"Cannot open video: {video_path}")
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            cap.release()
+    if width <= 0 or height <= 0:
+        return 0, 0, 0
+    start_frame, stride = frame_plan(fps, start_frame, start_time, frame_step, target_fps)
+    width, height = scaled_size(width, height, max_side, max_megapixels)
+    return width, height, expected_frames(total, start_frame, stride, max_frames)
+
+
+RESIZE_MODES = ["stretch", "letterbox", "center_crop"]
+
+
+def fit_frames(frames, out, rows, mode="stretch", chunk=16):
+    """Resize (n, h, w, C) frames into rows of out, an (N, H, W, C) float32 tensor.
+    uint8 frames are treated as 0-255. Runs as batched torch interpolation in chunks:
+    stretch ignores aspect, letterbox fits inside and pads black, center_crop fills and trims."""
+    n, h, w = frames.shape[:3]
+    height, width = out.shape[1:3]
+    if mode == "stretch":
+        rh, rw = height, width
+    else:
+        scale = max(height / h, width / w) if mode == "center_crop" else min(height / h, width / w)
+        rh, rw = max(1, round(h * scale)), max(1, round(w * scale))
+    # Crop offsets into the resized frame, or pad offsets into the output frame
+    crop_y, crop_x = max(0, (rh - height) // 2), max(0, (rw - width) // 2)
+    pad_y, pad_x = max(0, (height - rh) // 2), max(0, (width - rw) // 2)
+    fit_h, fit_w = min(rh, height), min(rw, width)
+
+    for start in range(0, n, chunk):
+        part = frames[start:start + chunk].permute(0, 3, 1, 2).float()
+        if frames.dtype == torch.uint8:
+            part.div_(255.0)
+        if (rh, rw) != (h, w):
+            part = F.interpolate(part, size=(rh, rw), mode="bilinear", align_corners=False, antialias=True)
+        part = part.permute(0, 2, 3, 1)[:, crop_y:crop_y + fit_h, crop_x:crop_x + fit_w]
+        idx = torch.as_tensor(rows[start:start + chunk], dtype=torch.long)
+        if (fit_h, fit_w) != (height, width):
+            out[idx] = 0.0
+        out[idx, pad_y:pad_y + fit_h, pad_x:pad_x + fit_w] = part
+
+
+def write_frames(frames, frame_mask, out, mask, start, mode="stretch"):
+    """Write decoded frames (and their mask) into out / mask from row start,
+    copying when the size matches and resizing with fit_frames otherwise."""
+    n = frames.shape[0]
+    if tuple(frames.shape[1:3]) == tuple(out.shape[1:3]):
+        out[start:start + n].copy_(frames)
+        if frame_mask is not None and mask is not None:
+            mask[start:start + n].copy_(frame_mask)
+        return
+    rows = list(range(start, start + n))
+    fit_frames(frames, out, rows, mode)
+    if frame_mask is not None and mask is not None:
+        fit_frames(frame_mask.unsqueeze(-1), mask.unsqueeze(-1), rows, mode)
+
+
+def place_clip(frames, frame_mask, out, mask, offset, count, mode="stretch"):
+    """Place a decoded clip into the count rows of out (and mask) reserved from
+    offset. Frames the extractor already wrote into those rows are left alone.
+    Returns (rows filled, overflow): overflow holds (IMAGE, MASK) for frames
+    beyond count, when the clip is longer than its metadata said, else None."""
+    n = frames.shape[0]
+    keep = min(n, count)
+    if keep and frames.data_ptr() != out[offset].data_ptr():
+        write_frames(frames[:keep], frame_mask[:keep] if frame_mask is not None else None,
+                     out, mask, offset, mode)
+    if n <= count:
+        return keep, None
+    extra = torch.empty((n - keep,) + tuple(out.shape[1:]), dtype=torch.float32)
+    extra_mask = torch.zeros((n - keep,) + tuple(mask.shape[1:]), dtype=torch.float32) if mask is not None else None
+    write_frames(frames[keep:], frame_mask[keep:] if frame_mask is not None else None,
+                 extra, extra_mask, 0, mode)
+    return keep, (extra, extra_mask)
+
+
+def load_media_batch(items, decode_opts=None, label="Batch", resize_mode="stretch", target_size=None):
+    """Decode selected media items into (IMAGE, MASK) batch tensors.
+    The output is allocated once at target_size (default: the first item's size),
+    sized from image headers, animation frame tables and video container metadata
+    (probe_video_output) before anything is decoded. decode_opts holds the
+    extract_video arguments; its max_side / max_megapixels caps apply to images too.
+    Images, animations and videos already at the target size decode straight into
+    their rows (images in parallel on _decode_pool). Off-size images decode into
+    per-size uint8 staging tensors and off-size clips decode one at a time, and both
+    are fitted with fit_frames, so every item shares one resize policy. Peak memory
+    is the output plus the largest off-size clip. A video whose container records
+    no frame count is decoded before allocating, and when a frame count is wrong
+    the batch is compacted with one extra copy. The MASK comes from the same decode
+    as the IMAGE: (N, H, W) when any item has alpha, else LoadImage's 64x64 placeholder."""
+    entries = []
+    for item in items:
+        filename = item.get("filename", "")
+        if not filename:
+            continue
+        if item.get("path"):
+            file_path = Path(item["path"])
+        else:
+            try:
+                file_path = resolve_media_path(item.get("type", "temp"), item.get("subfolder", ""), filename)
+            except ValueError as e:
+                print(f"[Vewd] {label}: {e}")
+                continue
+        if not file_path.exists():
+            print(f"[Vewd] {label}: file not found: {file_path}")
+            continue
+        media_type = item.get("media_type", "")
+        if media_type == "video" and HAS_VIDEO_DECODER:
+            entries.append(("video", file_path))
+        elif media_type == "image" or file_path.suffix.lower() in IMAGE_EXTS:
+            entries.append(("image", file_path))
+    if not entries:
+        return None
+
+    keys = [media_cache_key(path, kind) for kind, path in entries]
+    decode_opts = decode_opts or {}
+    target_size = tuple(target_size) if target_size else (0, 0)
+    batch_key = None
+    if all(keys):
+        batch_key = ("batch", tuple(keys), tuple(sorted(decode_opts.items())), resize_mode, target_size)
+        cached = _decode_cache.get(batch_key)
+        if cached is not None:
+            return cached
+
+    # Size everything before allocating: image headers, animation frame tables and
+    # video metadata. Only videos without a recorded frame count decode up front.
+    clips = {}
+    animated = set()
+    sizes = []
+    counts = []
+    alphas = []
+    max_side = decode_opts.get("max_side", 0)
+    max_megapixels = decode_opts.get("max_megapixels", 0.0)
+    for i, (kind, path) in enumerate(entries):
+        has_alpha = False
+        if kind == "video":
+            w, h, count = probe_video_output(path, **decode_opts)
+            if count <= 0:
+                frames = extract_video(path, **decode_opts)
+                clips[i] = (frames, None)
+                w, h, count = frames.shape[2], frames.shape[1], frames.shape[0]
+        else:
+            w, h, has_alpha, n_frames = probe_image(path)
+            w, h = scaled_size(w, h, max_side, max_megapixels)
+            count = 1
+            if n_frames > 1:
+                animated.add(i)
+                with Image.open(path) as img:
+                    count = len(animation_indices(img, **decode_opts))
+        sizes.append((w, h))
+        counts.append(count)
+        alphas.append(has_alpha)
+
+    width = target_size[0] or sizes[0][0]
+    height = target_size[1] or sizes[0][1]
+    total = sum(counts)
+    out = torch.empty((total, height, width, 3), dtype=torch.float32)
+    out_np = out.numpy()
+    # Rows without alpha stay zero (unmasked)
+    mask = torch.zeros((total, height, width), dtype=torch.float32) if any(alphas) else None
+    mask_np = mask.numpy() if mask is not None else None
+    futures = []
+    staged = {}
+    filled = list(counts)
+    overflow = {}
+    offset = 0
+    for i, (kind, path) in enumerate(entries):
+        if kind == "video" or i in animated:
+            # Clips at the target size decode straight into their rows
+            rows = out[offset:offset + counts[i]] if sizes[i] == (width, height) else None
+            if i in clips:
+                frames, frame_mask = clips.pop(i)
+            elif kind == "video":
+                frames, frame_mask = extract_video(path, out=rows, **decode_opts), None
+            else:
+                mask_rows = mask[offset:offset + counts[i]] if rows is not None and mask is not None else None
+                frames, frame_mask = extract_animated_frames(path, out=rows, mask_out=mask_rows, **decode_opts)
+                if not alphas[i]:
+                    frame_mask = None
+            filled[i], extra = place_clip(frames, frame_mask, out, mask, offset, counts[i], resize_mode)
+            if extra is not None:
+                overflow[i] = extra
+            del frames, frame_mask
+        elif sizes[i] == (width, height):
+            mask_dst = mask_np[offset] if alphas[i] else None
+            futures.append(_decode_pool.submit(decode_image_into, path, out_np[offset], mask_dst))
+        else:
+            staged.setdefault(sizes[i], []).append((path, offset, alphas[i]))
+        offset += counts[i]
+
+    # Off-size images: one uint8 staging tensor per source size, one batched resize each
+    for (w, h), group in staged.items():
+        staging = torch.empty((len(group), h, w, 3), dtype=torch.uint8)
+        staging_np = staging.numpy()
+        group_alpha = any(has_alpha for _, _, has_alpha in group)
+        staging_mask = torch.empty((len(group), h, w, 1), dtype=torch.uint8) if group_alpha else None
+        for j, (path, _, _) in enumerate(group):
+            mask_dst = staging_mask.numpy()[j, ..., 0] if group_alpha else None
+            futures.append(_decode_pool.submit(decode_image_into, path, staging_np[j], mask_dst))
+        for future in futures:
+            future.result()
+        futures = []
+        group_rows = [row for _, row, _ in group]
+        fit_frames(staging, out, group_rows, resize_mode)
+        if group_alpha:
+            fit_frames(staging_mask, mask.unsqueeze(-1), group_rows, resize_mode)
+    for future in futures:
+        future.result()
+
+    # Frame counts from metadata were off: drop unfilled rows and splice in extra frames
+    if overflow or filled != counts:
+        parts, mask_parts = [], []
+        offset = 0
+        for i in range(len(entries)):
+            parts.append(out[offset:offset + filled[i]])
+            if mask is not None:
+                mask_parts.append(mask[offset:offset + filled[i]])
+            if i in overflow:
+                parts.append(overflow[i][0])
+                if mask is not None:
+                    mask_parts.append(overflow[i][1])
+            offset += counts[i]
+        out = torch.cat(parts, dim=0)
+        mask = torch.cat(mask_parts, dim=0) if mask is not None else None
+        total = out.shape[0]
+
+    result = (out, mask if mask is not None else empty_mask(total))
+    if batch_key is not None:
+        _decode_cache.put(batch_key, result)
+    return result
+
+
+def make_load_opts(max_frames=0, start_frame=0, start_time=0.0, frame_step=1, target_fps=0.0,
+                   max_side=0, max_megapixels=0.0, video_backend="auto",
+                   resize_mode="stretch", batch_width=0, batch_height=0):
+    """Bundle the node's decode inputs; defaults match INPUT_TYPES."""
+    return {
+        "decode_opts": {
+            "max_frames": max_frames,
+            "start_frame": start_frame,
+            "start_time": start_time,
+            "frame_step": frame_step,
+            "target_fps": target_fps,
+            "max_side": max_side,
+            "max_megapixels": max_megapixels,
+            "backend": video_backend,
+        },
+        "resize_mode": resize_mode,
+        "target_size": (batch_width, batch_height),
+    }
+
+
+# Background pre-decode, started by the set_* endpoints so process() can join it.
+# Jobs live in NodeSession.predecodes.
+_predecode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vewd-predecode")
+
+
+def selection_signature(kind, payload, load_opts):
+    """Identity of a decode job: what is selected and how it is decoded."""
+    if kind == "batch":
+        payload = json.dumps(payload, sort_keys=True)
+    return (kind, str(payload), tuple(sorted(load_opts["decode_opts"].items())),
+            load_opts["resize_mode"], tuple(load_opts["target_size"]))
+
+
+def decode_selection(kind, payload, load_opts, label="Batch"):
+    """Decode a selection (a list of batch items, or a single video/image path)
+    to (IMAGE, MASK) tensors."""
+    decode_opts = load_opts["decode_opts"]
+    if kind == "batch":
+        return load_media_batch(payload, decode_opts, label, load_opts["resize_mode"], load_opts["target_size"])
+    if kind == "video":
+        frames = load_video_tensor(payload, **decode_opts)
+        return frames, empty_mask(frames.shape[0])
+    if probe_image(payload)[3] > 1:
+        return load_animated_tensor(payload, **decode_opts)
+    return load_image_tensor(payload, decode_opts["max_side"], decode_opts["max_megapixels"])
+
+
+def schedule_predecode(session, kind, payload):
+    """Start decoding a freshly set selection in the background, using the node's
+    last-used decode inputs (or the defaults before its first run).
+    Call inside _sessions.edit()."""
+    load_opts = session.load_opts or make_load_opts()
+    signature = selection_signature(kind, payload, load_opts)
+    current = session.predecodes.get(kind)
+    if current is not None:
+        if current[0] == signature:
+            return
+        current[1].cancel()
+    future = _predecode_pool.submit(decode_selection, kind, payload, load_opts, "Pre-decode")
+    session.predecodes[kind] = (signature, future)
+
+
+def cancel_predecode(session, kind):
+    entry = session.predecodes.pop(kind, None)
+    if entry is not None:
+        entry[1].cancel()
+
+
+def take_selection(node_id, kind, payload, load_opts, label="Batch"):
+    """Return the decoded selection, joining a matching in-flight or finished
+    pre-decode when there is one and decoding from scratch otherwise."""
+    entry = _sessions.pop_predecode(node_id, kind)
+    if entry is not None and entry[0] == selection_signature(kind, payload, load_opts):
+        try:
+            result = entry[1].result()
+            if result is not None:
+                return result
+        except Exception as e:
+            print(f"[Vewd] Pre-decode failed, decoding again: {e}")
+    elif entry is not None:
+        entry[1].cancel()
+    return decode_selection(kind, payload, load_opts, label)
 
 
 BINARY_EXTS = {'.glb', '.gltf', '.obj', '.ply', '.splat', '.stl'}
@@ -62,34 +1249,294 @@ MEDIA_EXTS = {'.mp4', '.webm', '.mov', '.avi', '.mkv', '.mp3', '.wav', '.ogg', '
 AUDIO_CONVERT_TO_MP3 = {'.flac', '.wav', '.ogg', '.aac'}  # Convert these to MP3 on save
 
 
-def copy_with_metadata(src_path, dst_path, seed=None):
+LINK_MODES = ("auto", "hardlink", "copy")
+FICLONE = 0x40049409  # Linux ioctl: share file extents (btrfs, XFS, bcachefs)
+
+
+def _reflink(src_path, dst_path):
+    """Clone src into dst without copying data. Returns False where unsupported."""
+    if not HAS_FCNTL or not hasattr(os, "copy_file_range"):
+        return False  # FICLONE is Linux-only, as is copy_file_range
+    try:
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        return False
+    shutil.copystat(src_path, dst_path)
+    return True
+
+
+def _copy_file_range(src_path, dst_path):
+    """In-kernel copy; filesystems that support it share extents instead of copying."""
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(src.fileno(), dst.fileno(), min(remaining, 1 << 30))
+            if copied == 0:
+                break
+            remaining -= copied
+    shutil.copystat(src_path, dst_path)
+
+
+@contextmanager
+def replacing(dst_path):
+    """Yield a temporary path next to dst_path and rename it over dst_path on success.
+    An existing dst (possibly a hardlink to some other file) is replaced, never
+    written through, and a failed write leaves it untouched."""
+    dst_path = Path(dst_path)
+    tmp_path = dst_path.with_name(f".{dst_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, dst_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _place(src_path, tmp_path, link_mode):
+    """Create tmp_path (which must not exist) from src; returns the strategy used."""
+    if link_mode != "copy":
+        try:
+            same_fs = os.stat(src_path).st_dev == os.stat(tmp_path.parent).st_dev
+        except OSError:
+            same_fs = False
+        if same_fs:
+            if _reflink(src_path, tmp_path):
+                return "reflink"
+            if link_mode == "hardlink":
+                try:
+                    tmp_path.unlink(missing_ok=True)
+                    os.link(src_path, tmp_path)
+                    return "hardlink"
+                except OSError:
+                    pass
+        # copy_file_range silently degrades to an in-kernel byte copy, so it comes after hardlink
+        if hasattr(os, "copy_file_range"):
+            try:
+                _copy_file_range(src_path, tmp_path)
+                return "copy_file_range"
+            except OSError:
+                pass
+    shutil.copy2(src_path, tmp_path)
+    return "copy"
+
+
+def link_or_copy(src_path, dst_path, link_mode="auto"):
+    """Place src at dst as cheaply as the filesystem allows and return the strategy used:
+    reflink, hardlink (only when link_mode is "hardlink"), copy_file_range, or copy.
+    Hardlinks share the inode, so later edits to either file show in both; dst itself
+    is always swapped in by rename (see replacing), so overwriting an earlier
+    hardlinked export never writes into its source."""
+    src_path, dst_path = Path(src_path), Path(dst_path)
+    if dst_path.exists() and os.path.samefile(src_path, dst_path):
+        if src_path.resolve() == dst_path.resolve():
+            return "existing"
+        if link_mode == "hardlink":
+            return "hardlink"
+    with replacing(dst_path) as tmp_path:
+        return _place(src_path, tmp_path, link_mode)
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_TEXT_CHUNKS = (b"tEXt", b"zTXt", b"iTXt")
+
+
+def png_text_chunk(key, value):
+    """Encode a PNG tEXt chunk (length, type, keyword\\0text, CRC)."""
+    data = key.encode("latin-1") + b"\0" + str(value).encode("latin-1")
+    return struct.pack(">I", len(data)) + b"tEXt" + data + struct.pack(">I", zlib.crc32(b"tEXt" + data))
+
+
+def _copy_bytes(src, dst, length, block=1 << 20):
+    while length > 0:
+        data = src.read(min(block, length))
+        if not data:
+            raise ValueError("Truncated PNG")
+        dst.write(data)
+        length -= len(data)
+
+
+def splice_png_text(src_path, dst_path, key, value):
+    """Copy a PNG chunk by chunk, replacing or adding one text chunk before IEND.
+    IDAT and every other chunk stream through byte for byte, so pixels are never
+    decoded or recompressed. Raises ValueError if src is not a well-formed PNG."""
+    keyword = key.encode("latin-1")
+    with replacing(dst_path) as tmp_path, open(src_path, "rb") as src, open(tmp_path, "wb") as dst:
+        if src.read(8) != PNG_SIGNATURE:
+            raise ValueError(f"Not a PNG file: {src_path}")
+        dst.write(PNG_SIGNATURE)
+        while True:
+            header = src.read(8)
+            if len(header) < 8:
+                raise ValueError(f"Truncated PNG: {src_path}")
+            length, chunk_type = struct.unpack(">I4s", header)
+            if chunk_type == b"IEND":
+                dst.write(png_text_chunk(key, value))
+                dst.write(header)
+                _copy_bytes(src, dst, length + 4)
+                return
+            if chunk_type in PNG_TEXT_CHUNKS:
+                body = src.read(length + 4)
+                if body.split(b"\0", 1)[0] == keyword:
+                    continue  # Replaced by the new chunk before IEND
+                dst.write(header)
+                dst.write(body)
+                continue
+            dst.write(header)
+            _copy_bytes(src, dst, length + 4)
+
+
+# MP3 conversions run one per core; export jobs queue audio files here directly
+_transcode_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="vewd-transcode")
+_content_digests = OrderedDict()  # (path, mtime_ns, size) -> content digest, oldest first
+MAX_CONTENT_DIGESTS = 4096
+_transcode_locks = {}  # digest -> [Lock, users], so identical sources transcode once
+_transcode_locks_guard = threading.Lock()
+
+
+def content_digest(path):
+    """Hash of a file's bytes, memoized per (path, mtime, size) for the most
+    recent MAX_CONTENT_DIGESTS file versions."""
+    st = os.stat(path)
+    key = (str(Path(path).resolve()), st.st_mtime_ns, st.st_size)
+    with _transcode_locks_guard:
+        digest = _content_digests.get(key)
+        if digest is not None:
+            _content_digests.move_to_end(key)
+            return digest
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _transcode_locks_guard:
+        _content_digests[key] = digest
+        while len(_content_digests) > MAX_CONTENT_DIGESTS:
+            _content_digests.popitem(last=False)
+    return digest
+
+
+class StallWatchdog:
+    """Kills a subprocess that shows no progress for stall_timeout seconds, however
+    long it runs in total. Call touch() on every sign of progress and stop() when
+    finished; stalled is set if the process was killed."""
+
+    def __init__(self, proc, stall_timeout):
+        self.proc = proc
+        self.stall_timeout = stall_timeout
+        self.stalled = threading.Event()
+        self._last = time.monotonic()
+        self._done = threading.Event()
+        threading.Thread(target=self._run, name="vewd-ffmpeg-watchdog", daemon=True).start()
+
+    def touch(self):
+        self._last = time.monotonic()
+
+    def stop(self):
+        self._done.set()
+
+    def _run(self):
+        while not self._done.wait(1.0):
+            if time.monotonic() - self._last > self.stall_timeout:
+                self.stalled.set()
+                self.proc.kill()
+                return
+
+
+def run_ffmpeg_watched(args, stall_timeout=30):
+    """Run ffmpeg with args, killing it if its -progress reports stop for
+    stall_timeout seconds, so long files are never cut off by a total deadline.
+    Returns (returncode, error text)."""
+    proc = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-nostdin", "-nostats", "-progress", "pipe:1"] + args,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    watchdog = StallWatchdog(proc, stall_timeout)
+    errors = []
+    try:
+        for line in proc.stdout:
+            watchdog.touch()
+            line = line.decode(errors="replace").strip()
+            if line and "=" not in line.split(" ", 1)[0]:  # not a key=value progress line
+                errors = (errors + [line])[-5:]
+    finally:
+        watchdog.stop()
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+    if watchdog.stalled.is_set():
+        raise TimeoutError(f"ffmpeg made no progress for {stall_timeout}s")
+    return proc.returncode, "\n".join(errors)
+
+
+def transcode_to_mp3(src_path):
+    """Return (mp3_path, was_cached) for src_path from the vewd-cache mp3/ entries,
+    keyed by content so renamed or re-exported copies reuse one conversion.
+    ffmpeg runs under a stall watchdog rather than a total timeout, so long stems
+    convert as long as they keep making progress."""
+    digest = content_digest(src_path)
+    name = f"mp3/{digest}.mp3"
+    with _transcode_locks_guard:
+        entry = _transcode_locks.setdefault(digest, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            cached = _disk_cache.get(name)
+            if cached is not None and cached.exists():
+                return cached, True
+            cached = _disk_cache.path(name)
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cached.with_name(f"{digest}.{uuid.uuid4().hex}.tmp.mp3")
+            try:
+                returncode, errors = run_ffmpeg_watched(
+                    ["-y", "-i", str(src_path), "-codec:a", "libmp3lame", "-q:a", "2", str(tmp_path)]
+                )
+                if returncode != 0:
+                    raise RuntimeError(f"ffmpeg conversion failed: {errors[:200]}")
+                os.replace(tmp_path, cached)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+            _disk_cache.add(name)
+        return cached, False
+    finally:
+        # Drop the lock once no export is using it, so the table doesn't grow per file
+        with _transcode_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _transcode_locks.pop(digest, None)
+
+
+def copy_with_metadata(src_path, dst_path, seed=None, link_mode="auto"):
     """Copy file, embedding seed as PNG metadata if applicable.
     For audio files in AUDIO_CONVERT_TO_MP3, converts to MP3 via ffmpeg.
-    For 3D model files and other non-PNG files, does a plain file copy."""
+    For 3D model files and other files that need no rewriting, links or copies via
+    link_or_copy. Returns (strategy, path written): the strategy is one of link_or_copy's,
+    "transcode", "transcode-cached", "transcode-failed" (original copied under its own
+    extension instead of dst_path) or "png-meta"."""
     ext = Path(src_path).suffix.lower()
     if ext in BINARY_EXTS:
-        shutil.copy2(src_path, dst_path)
-        return
-    # Convert audio to MP3
+        return link_or_copy(src_path, dst_path, link_mode), dst_path
+    # Convert audio to MP3 (served from the transcode cache when already converted)
     if ext in AUDIO_CONVERT_TO_MP3:
         try:
-            import subprocess
-            result = subprocess.run(
-                ["ffmpeg", "-y", "-i", str(src_path), "-codec:a", "libmp3lame", "-q:a", "2", str(dst_path)],
-                capture_output=True, timeout=30
-            )
-            if result.returncode == 0:
-                return
-            print(f"[Vewd] ffmpeg conversion failed: {result.stderr.decode()[:200]}")
+            mp3_path, cached = transcode_to_mp3(src_path)
+            link_or_copy(mp3_path, dst_path, link_mode)
+            return ("transcode-cached" if cached else "transcode"), dst_path
         except Exception as e:
-            print(f"[Vewd] ffmpeg not available, copying as-is: {e}")
+            print(f"[Vewd] MP3 conversion failed, copying as-is: {e}")
         # Fallback: copy original if ffmpeg fails
-        shutil.copy2(src_path, Path(str(dst_path).rsplit('.', 1)[0] + ext))
-        return
+        fallback_path = Path(dst_path).with_suffix(ext)
+        link_or_copy(src_path, fallback_path, link_mode)
+        return "transcode-failed", fallback_path
     if ext in MEDIA_EXTS:
-        shutil.copy2(src_path, dst_path)
-        return
+        return link_or_copy(src_path, dst_path, link_mode), dst_path
     if seed and ext == '.png':
+        try:
+            splice_png_text(src_path, dst_path, "seed", seed)
+            return "png-meta", dst_path
+        except ValueError:
+            pass  # Not really a PNG — re-encode below
         try:
             img = Image.open(src_path)
             meta = PngImagePlugin.PngInfo()
@@ -98,11 +1545,12 @@ def copy_with_metadata(src_path, dst_path, seed=None):
                 for k, v in img.text.items():
                     meta.add_text(k, v)
             meta.add_text("seed", str(seed))
-            img.save(dst_path, pnginfo=meta)
-            return
+            with replacing(dst_path) as tmp_path:
+                img.save(tmp_path, format="PNG", pnginfo=meta)
+            return "png-meta", dst_path
         except Exception:
             pass
-    shutil.copy2(src_path, dst_path)
+    return link_or_copy(src_path, dst_path, link_mode), dst_path
 
 class Vewd:
     """
@@ -120,6 +1568,16 @@ class Vewd:
                 "filename_prefix": ("STRING", {"default": "vewd"}),
                 "max_frames": ("INT", {"default": 0, "min": 0, "max": 9999, "step": 1, "tooltip": "Max video frames to extract (0 = all)"}),
                 "selected_media": ("STRING", {"default": ""}),
+                "start_frame": ("INT", {"default": 0, "min": 0, "max": 1000000, "step": 1, "tooltip": "First video frame to extract"}),
+                "start_time": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 86400.0, "step": 0.1, "tooltip": "Start time in seconds (overrides start_frame when > 0)"}),
+                "frame_step": ("INT", {"default": 1, "min": 1, "max": 1000, "step": 1, "tooltip": "Keep every Nth video frame"}),
+                "target_fps": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 240.0, "step": 0.5, "tooltip": "Resample video to this frame rate (0 = source fps, overrides frame_step)"}),
+                "max_side": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8, "tooltip": "Downscale images and video frames so the longest side fits (0 = original)"}),
+                "video_backend": (VIDEO_BACKENDS, {"default": "auto", "tooltip": "Video decoder: auto prefers cv2, falls back to ffmpeg"}),
+                "max_megapixels": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1000.0, "step": 0.1, "tooltip": "Downscale images and video frames above this many megapixels (0 = no limit)"}),
+                "resize_mode": (RESIZE_MODES, {"default": "stretch", "tooltip": "How multi-select items of different sizes are fitted into one batch"}),
+                "batch_width": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8, "tooltip": "Batch output width (0 = first item's width)"}),
+                "batch_height": ("INT", {"default": 0, "min": 0, "max": 16384, "step": 8, "tooltip": "Batch output height (0 = first item's height)"}),
             },
             "hidden": {
                 "prompt": "PROMPT",
@@ -128,8 +1586,8 @@ class Vewd:
             },
         }
 
-    RETURN_TYPES = ("IMAGE",)
-    RETURN_NAMES = ("output",)
+    RETURN_TYPES = ("IMAGE", "MASK")
+    RETURN_NAMES = ("output", "mask")
     FUNCTION = "process"
     CATEGORY = "image"
 
@@ -137,11 +1595,23 @@ class Vewd:
     def IS_CHANGED(cls, **kwargs):
         return float("NaN")
 
-    def process(self, input=None, folder="", filename_prefix="vewd", max_frames=0, selected_media="", prompt=None, extra_pnginfo=None, unique_id=None):
+    def process(self, input=None, folder="", filename_prefix="vewd", max_frames=0, selected_media="",
+                start_frame=0, start_time=0.0, frame_step=1, target_fps=0.0, max_side=0,
+                video_backend="auto", max_megapixels=0.0, resize_mode="stretch", batch_width=0, batch_height=0,
+                prompt=None, extra_pnginfo=None, unique_id=None):
         folder = folder.strip('"')
         result = {"ui": {"vewd_images": []}}
         img_tensor = None
+        mask_tensor = None
         node_key = str(unique_id) if unique_id else None
+        load_opts = make_load_opts(max_frames, start_frame, start_time, frame_step, target_fps,
+                                   max_side, max_megapixels, video_backend,
+                                   resize_mode, batch_width, batch_height)
+        session = None
+        if node_key:
+            session = _sessions.snapshot(node_key)
+            # Remembered so the next selection change pre-decodes with these inputs
+            _sessions.set_load_opts(node_key, load_opts)
 
         # Priority: wired input > selected_media widget > video store > image store > screenshot store > black fallback
         if input is not None:
@@ -154,230 +1624,243 @@ class Vewd:
                 parsed = json.loads(selected_media)
                 # Normalize to list
                 media_list = parsed if isinstance(parsed, list) else [parsed]
+                # Only paths resolved (and contained) server-side are trusted
+                resolve_batch_items(media_list)
 
-                type_dirs = {
-                    "temp": folder_paths.get_temp_directory(),
-                    "output": folder_paths.get_output_directory(),
-                    "input": folder_paths.get_input_directory(),
-                }
-
-                loaded_tensors = []
-                target_size = None
-
-                for media_info in media_list:
-                    media_type = media_info.get("media_type", "")
-                    filename = media_info.get("filename", "")
-                    subfolder = media_info.get("subfolder", "")
-                    source_type = media_info.get("type", "temp")
-
-                    if not filename:
-                        continue
-
-                    base_dir = type_dirs.get(source_type, folder_paths.get_temp_directory())
-                    file_path = Path(base_dir) / subfolder / filename if subfolder else Path(base_dir) / filename
-
-                    if not file_path.exists():
-                        print(f"[Vewd] Widget: file not found: {file_path}")
-                        continue
-
-                    if media_type == "video" and HAS_CV2:
-                        frames = extract_video_frames(file_path, max_frames)
-                        print(f"[Vewd] Widget: extracted {frames.shape[0]} frames from {file_path.name}")
-                        loaded_tensors.append(frames)
-                    elif media_type == "image" or file_path.suffix.lower() in ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif'):
-                        img = Image.open(file_path).convert("RGB")
-                        # Resize to match first image (batch tensors must be same size)
-                        if target_size is None:
-                            target_size = img.size
-                        elif img.size != target_size:
-                            img = img.resize(target_size, Image.LANCZOS)
-                        img_array = np.array(img).astype(np.float32) / 255.0
-                        loaded_tensors.append(torch.from_numpy(img_array).unsqueeze(0))
-
-                if loaded_tensors:
-                    img_tensor = torch.cat(loaded_tensors, dim=0)
+                # Join the batch pre-decode /vewd/sync started for this same selection
+                if node_key:
+                    batch = take_selection(node_key, "batch", media_list, load_opts, "Widget")
+                else:
+                    batch = decode_selection("batch", media_list, load_opts, "Widget")
+                if batch is not None:
+                    img_tensor, mask_tensor = batch
                     print(f"[Vewd] Widget: batch of {img_tensor.shape[0]} frames ({img_tensor.shape[2]}x{img_tensor.shape[1]})")
 
             except Exception as e:
                 print(f"[Vewd] Widget: selected_media parse failed: {e}")
 
-        # Batch store — multiple selected items via HTTP endpoint
-        if img_tensor is None and node_key and node_key in _batch_store:
-            batch_items = _batch_store[node_key]
-            type_dirs = {
-                "temp": folder_paths.get_temp_directory(),
-                "output": folder_paths.get_output_directory(),
-                "input": folder_paths.get_input_directory(),
-            }
-            loaded_tensors = []
-            target_size = None
-            for item in batch_items:
-                media_type = item.get("media_type", "")
-                filename = item.get("filename", "")
-                subfolder = item.get("subfolder", "")
-                source_type = item.get("type", "temp")
-                if not filename:
-                    continue
-                base_dir = type_dirs.get(source_type, folder_paths.get_temp_directory())
-                file_path = Path(base_dir) / subfolder / filename if subfolder else Path(base_dir) / filename
-                if not file_path.exists():
-                    print(f"[Vewd] Batch: file not found: {file_path}")
-                    continue
-                if media_type == "video" and HAS_CV2:
-                    frames = extract_video_frames(file_path, max_frames)
-                    loaded_tensors.append(frames)
-                elif media_type == "image" or file_path.suffix.lower() in ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif'):
-                    img = Image.open(file_path).convert("RGB")
-                    if target_size is None:
-                        target_size = img.size
-                    elif img.size != target_size:
-                        img = img.resize(target_size, Image.LANCZOS)
-                    img_array = np.array(img).astype(np.float32) / 255.0
-                    loaded_tensors.append(torch.from_numpy(img_array).unsqueeze(0))
-            if loaded_tensors:
-                img_tensor = torch.cat(loaded_tensors, dim=0)
+        # Batch selection — multiple selected items via HTTP endpoint
+        if img_tensor is None and session and session["batch"]:
+            batch = take_selection(node_key, "batch", session["batch"], load_opts, "Batch")
+            if batch is not None:
+                img_tensor, mask_tensor = batch
                 print(f"[Vewd] Batch: {img_tensor.shape[0]} frames ({img_tensor.shape[2]}x{img_tensor.shape[1]})")
-            # Clear batch after use so single-select works next time
-            del _batch_store[node_key]
 
-        if img_tensor is None and node_key and node_key in _video_store and HAS_CV2:
-            video_info = _video_store[node_key]
+        if img_tensor is None and session and session["video"] and HAS_VIDEO_DECODER:
+            video_info = session["video"]
             try:
-                # Resolve video file path
-                type_dirs = {
-                    "temp": folder_paths.get_temp_directory(),
-                    "output": folder_paths.get_output_directory(),
-                    "input": folder_paths.get_input_directory(),
-                }
-                base_dir = type_dirs.get(video_info.get("type", "temp"), folder_paths.get_temp_directory())
-                subfolder = video_info.get("subfolder", "")
-                filename = video_info["filename"]
-                video_path = Path(base_dir) / subfolder / filename if subfolder else Path(base_dir) / filename
+                video_path = Path(video_info["path"])
 
                 if video_path.exists():
-                    img_tensor = extract_video_frames(video_path, max_frames)
+                    img_tensor, mask_tensor = take_selection(node_key, "video", video_path, load_opts)
                     print(f"[Vewd] Extracted {img_tensor.shape[0]} frames from {video_path.name}")
                 else:
                     print(f"[Vewd] Video file not found: {video_path}")
             except Exception as e:
                 print(f"[Vewd] Video extraction failed: {e}")
 
-        if img_tensor is None and node_key and node_key in _image_store:
-            image_info = _image_store[node_key]
+        if img_tensor is None and session and session["image"]:
+            image_info = session["image"]
             try:
-                type_dirs = {
-                    "temp": folder_paths.get_temp_directory(),
-                    "output": folder_paths.get_output_directory(),
-                    "input": folder_paths.get_input_directory(),
-                }
-                base_dir = type_dirs.get(image_info.get("type", "temp"), folder_paths.get_temp_directory())
-                subfolder = image_info.get("subfolder", "")
-                filename = image_info["filename"]
-                img_path = Path(base_dir) / subfolder / filename if subfolder else Path(base_dir) / filename
+                img_path = Path(image_info["path"])
 
                 if img_path.exists():
-                    img = Image.open(img_path).convert("RGB")
-                    img_array = np.array(img).astype(np.float32) / 255.0
-                    img_tensor = torch.from_numpy(img_array).unsqueeze(0)
-                    print(f"[Vewd] Loaded image from disk: {img_path.name} ({img.size[0]}x{img.size[1]})")
+                    img_tensor, mask_tensor = take_selection(node_key, "image", img_path, load_opts)
+                    print(f"[Vewd] Loaded image from disk: {img_path.name} ({img_tensor.shape[2]}x{img_tensor.shape[1]})")
                 else:
                     print(f"[Vewd] Image file not found: {img_path}")
             except Exception as e:
                 print(f"[Vewd] Image load failed: {e}")
 
-        if img_tensor is None and node_key and node_key in _screenshot_store:
-            img_data = _screenshot_store[node_key]
-            try:
-                img = Image.open(io.BytesIO(img_data)).convert("RGB")
-                img_array = np.array(img).astype(np.float32) / 255.0
-                img_tensor = torch.from_numpy(img_array).unsqueeze(0)
-            except Exception as e:
-                print(f"[Vewd] Failed to load screenshot: {e}")
+        # Screenshots are decoded once on upload
+        if img_tensor is None and session:
+            img_tensor = session["screenshot"]
 
-        # Legacy fallback: try any screenshot if node-specific not found
-        if img_tensor is None and _screenshot_store:
-            latest_key = max(_screenshot_store.keys())
-            img_data = _screenshot_store[latest_key]
-            try:
-                img = Image.open(io.BytesIO(img_data)).convert("RGB")
-                img_array = np.array(img).astype(np.float32) / 255.0
-                img_tensor = torch.from_numpy(img_array).unsqueeze(0)
-            except Exception as e:
-                print(f"[Vewd] Failed to load screenshot: {e}")
+        # Legacy fallback: most recent screenshot from any node
+        if img_tensor is None:
+            img_tensor = _sessions.latest_screenshot()
 
         # Always return an image tensor (black 512x512 fallback)
         if img_tensor is None:
             img_tensor = torch.zeros(1, 512, 512, 3)
+        if mask_tensor is None:
+            mask_tensor = empty_mask(img_tensor.shape[0])
 
-        result["result"] = (img_tensor,)
+        # Clear the batch after use so single-select works next time, and release
+        # pre-decodes this run didn't join so their tensors aren't held until eviction
+        if session:
+            _sessions.finish_run(node_key, session["version"])
+
+        result["result"] = (img_tensor, mask_tensor)
         return result
 
 
-# Export API route
+def export_save_ext(filename):
+    """Extension an exported file is written with."""
+    orig_ext = Path(filename).suffix.lower()
+    if orig_ext in BINARY_EXTS:
+        return orig_ext
+    if orig_ext in AUDIO_CONVERT_TO_MP3:
+        return ".mp3"
+    if orig_ext in MEDIA_EXTS:
+        return orig_ext
+    return ".png"
+
+
+def parse_export_item(img_info):
+    """Normalize an export item: old format (string) or object with source info."""
+    if isinstance(img_info, str):
+        return img_info, "", "temp", None
+    return img_info.get("filename", ""), img_info.get("subfolder", ""), img_info.get("type", "temp"), img_info.get("seed")
+
+
+def plan_export(folder, prefix, images):
+    """Resolve sources and destination names for /vewd/export (into folder/selects)."""
+    selects_dir = Path(folder) / "selects"
+    selects_dir.mkdir(parents=True, exist_ok=True)
+    tasks = []
+    debug = []
+    for i, img_info in enumerate(images):
+        filename, subfolder, source_type, seed = parse_export_item(img_info)
+        try:
+            src_path = resolve_media_path(source_type, subfolder, filename)
+        except ValueError as e:
+            debug.append({"filename": filename, "type": source_type, "subfolder": subfolder, "error": str(e)})
+            continue
+        tried = [str(src_path)]
+        if not src_path.exists():
+            src_path = Path(folder) / filename
+            tried.append(str(src_path))
+        if not src_path.exists():
+            debug.append({"filename": filename, "type": source_type, "subfolder": subfolder, "tried": tried})
+            continue
+        save_ext = export_save_ext(filename)
+        if seed:
+            new_name = f"{prefix}_{seed}_{i + 1:03d}{save_ext}"
+        else:
+            new_name = f"{prefix}_{Path(filename).stem}{save_ext}"
+        tasks.append((filename, src_path, selects_dir / new_name, seed))
+    return selects_dir, tasks, debug
+
+
+def plan_save(folder, prefix, images):
+    """Resolve sources and destination names for /vewd/save (directly into folder)."""
+    save_dir = Path(folder)
+    save_dir.mkdir(parents=True, exist_ok=True)
+    tasks = []
+    debug = []
+    # Find next available number per seed
+    seed_counters = {}
+    for img_info in images:
+        filename, subfolder, source_type, seed = parse_export_item(img_info)
+        try:
+            src_path = resolve_media_path(source_type, subfolder, filename)
+        except ValueError as e:
+            debug.append({"filename": filename, "type": source_type, "subfolder": subfolder, "error": str(e)})
+            continue
+        tried = [str(src_path)]
+        if not src_path.exists():
+            src_path = Path(folder) / filename
+            tried.append(str(src_path))
+        if not src_path.exists():
+            debug.append({"filename": filename, "type": source_type, "subfolder": subfolder, "tried": tried})
+            continue
+        save_ext = export_save_ext(filename)
+        if seed:
+            # With seed: prefix_seed_001.ext
+            if seed not in seed_counters:
+                seed_counters[seed] = len(list(save_dir.glob(f"{prefix}_{seed}_*{save_ext}")))
+            seed_counters[seed] += 1
+            new_name = f"{prefix}_{seed}_{seed_counters[seed]:03d}{save_ext}"
+        else:
+            # No seed: use original ComfyUI filename
+            new_name = f"{prefix}_{Path(filename).stem}{save_ext}"
+        tasks.append((filename, src_path, save_dir / new_name, seed))
+    return save_dir, tasks, debug
+
+
+# Export/save file I/O and ffmpeg run here, never on the aiohttp event loop
+_export_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 2), thread_name_prefix="vewd-export")
+# Planning gets its own pool so a new request never queues behind another job's file copies
+_plan_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vewd-export-plan")
+_export_jobs = OrderedDict()  # job_id -> ExportJob, oldest first
+MAX_EXPORT_JOBS = 50
+
+
+class ExportJob:
+    """Progress of one export/save request, with a result entry per file."""
+
+    def __init__(self, kind, folder, tasks, debug, link_mode="auto"):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.link_mode = link_mode
+        self.folder = str(folder)
+        self.total = len(tasks)
+        self.done = 0
+        self.count = 0
+        self.results = []
+        self.debug = debug
+        self._lock = threading.Lock()
+
+    def run_file(self, filename, src_path, dst_path, seed):
+        try:
+            strategy, written = copy_with_metadata(src_path, dst_path, seed, self.link_mode)
+            entry = {"filename": filename, "dst": written.name, "status": "ok", "strategy": strategy}
+        except Exception as e:
+            entry = {"filename": filename, "dst": dst_path.name, "status": "error", "error": str(e)}
+        with self._lock:
+            self.results.append(entry)
+            self.done += 1
+            if entry["status"] == "ok":
+                self.count += 1
+
+    def status(self):
+        with self._lock:
+            return {
+                "success": True,
+                "job_id": self.id,
+                "kind": self.kind,
+                "state": "done" if self.done >= self.total else "running",
+                "total": self.total,
+                "done": self.done,
+                "count": self.count,
+                "folder": self.folder,
+                "results": list(self.results),
+                "debug": self.debug,
+            }
+
+
+async def start_export_job(kind, data, plan):
+    """Plan an export on _plan_pool, queue its files on _export_pool and return the job."""
+    folder = data.get("folder", "").strip('"')
+    prefix = data.get("prefix", "select" if kind == "export" else "vewd")
+    images = data.get("images", [])
+    if not folder or not images:
+        return None
+    loop = asyncio.get_running_loop()
+    out_dir, tasks, debug = await loop.run_in_executor(_plan_pool, plan, folder, prefix, images)
+    link_mode = data.get("link_mode", "auto")
+    if link_mode not in LINK_MODES:
+        link_mode = "auto"
+    job = ExportJob(kind, out_dir, tasks, debug, link_mode)
+    _export_jobs[job.id] = job
+    while len(_export_jobs) > MAX_EXPORT_JOBS:
+        _export_jobs.popitem(last=False)
+    for task in tasks:
+        pool = _transcode_pool if task[1].suffix.lower() in AUDIO_CONVERT_TO_MP3 else _export_pool
+        pool.submit(job.run_file, *task)
+    return job
+
+
+# Export API route — returns a job id immediately; poll /vewd/export_status
 @PromptServer.instance.routes.post("/vewd/export")
 async def export_selects(request):
     try:
         data = await request.json()
-        folder = data.get("folder", "").strip('"')
-        prefix = data.get("prefix", "select")
-        images = data.get("images", [])
-
-        if not folder or not images:
+        job = await start_export_job("export", data, plan_export)
+        if job is None:
             return web.json_response({"success": False, "error": "Missing folder or images"})
-
-        # Create selects subfolder
-        selects_dir = Path(folder) / "selects"
-        selects_dir.mkdir(parents=True, exist_ok=True)
-
-        temp_dir = folder_paths.get_temp_directory()
-        output_dir = folder_paths.get_output_directory()
-        input_dir = folder_paths.get_input_directory()
-        count = 0
-        debug = []
-
-        for i, img_info in enumerate(images):
-            # Support both old format (string) and new format (object with source info)
-            if isinstance(img_info, str):
-                filename = img_info
-                subfolder = ""
-                source_type = "temp"
-            else:
-                filename = img_info.get("filename", "")
-                subfolder = img_info.get("subfolder", "")
-                source_type = img_info.get("type", "temp")
-                seed = img_info.get("seed")
-
-            # Resolve source path based on type
-            type_dirs = {"temp": temp_dir, "output": output_dir, "input": input_dir}
-            base_dir = type_dirs.get(source_type, temp_dir)
-            src_path = Path(base_dir) / subfolder / filename if subfolder else Path(base_dir) / filename
-            tried = [str(src_path)]
-            if not src_path.exists():
-                src_path = Path(folder) / filename
-                tried.append(str(src_path))
-
-            if src_path.exists():
-                orig_ext = Path(filename).suffix.lower()
-                if orig_ext in BINARY_EXTS:
-                    save_ext = orig_ext
-                elif orig_ext in AUDIO_CONVERT_TO_MP3:
-                    save_ext = ".mp3"
-                elif orig_ext in MEDIA_EXTS:
-                    save_ext = orig_ext
-                else:
-                    save_ext = ".png"
-                if seed:
-                    new_name = f"{prefix}_{seed}_{i + 1:03d}{save_ext}"
-                else:
-                    orig_stem = Path(filename).stem
-                    new_name = f"{prefix}_{orig_stem}{save_ext}"
-                dst_path = selects_dir / new_name
-                copy_with_metadata(src_path, dst_path, seed)
-                count += 1
-            else:
-                debug.append({"filename": filename, "type": source_type, "subfolder": subfolder, "tried": tried})
-
-        return web.json_response({"success": True, "count": count, "folder": str(selects_dir), "debug": debug})
+        return web.json_response({"success": True, "job_id": job.id, "total": job.total, "folder": job.folder, "debug": job.debug})
 
     except Exception as e:
         return web.json_response({"success": False, "error": str(e)})
@@ -388,92 +1871,157 @@ async def export_selects(request):
 async def save_images(request):
     try:
         data = await request.json()
-        folder = data.get("folder", "").strip('"')
-        prefix = data.get("prefix", "vewd")
-        images = data.get("images", [])
-
-        if not folder or not images:
+        job = await start_export_job("save", data, plan_save)
+        if job is None:
             return web.json_response({"success": False, "error": "Missing folder or images"})
+        return web.json_response({"success": True, "job_id": job.id, "total": job.total, "folder": job.folder, "debug": job.debug})
 
-        save_dir = Path(folder)
-        save_dir.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        return web.json_response({"success": False, "error": str(e)})
 
-        temp_dir = folder_paths.get_temp_directory()
-        output_dir = folder_paths.get_output_directory()
-        input_dir = folder_paths.get_input_directory()
-        count = 0
 
-        # Find next available number per seed
-        seed_counters = {}
+@PromptServer.instance.routes.get("/vewd/export_status")
+async def export_status(request):
+    """Progress and per-file results of an export/save job."""
+    job = _export_jobs.get(request.query.get("job_id", ""))
+    if job is None:
+        return web.json_response({"success": False, "error": "Unknown job"}, status=404)
+    return web.json_response(job.status(), headers=NO_STORE)
 
-        for i, img_info in enumerate(images):
-            if isinstance(img_info, str):
-                filename = img_info
-                subfolder = ""
-                source_type = "temp"
-                seed = None
-            else:
-                filename = img_info.get("filename", "")
-                subfolder = img_info.get("subfolder", "")
-                source_type = img_info.get("type", "temp")
-                seed = img_info.get("seed")
-
-            type_dirs = {"temp": temp_dir, "output": output_dir, "input": input_dir}
-            base_dir = type_dirs.get(source_type, temp_dir)
-            src_path = Path(base_dir) / subfolder / filename if subfolder else Path(base_dir) / filename
-            if not src_path.exists():
-                src_path = Path(folder) / filename
-
-            if src_path.exists():
-                orig_ext = Path(filename).suffix.lower()
-                if orig_ext in BINARY_EXTS:
-                    save_ext = orig_ext
-                elif orig_ext in AUDIO_CONVERT_TO_MP3:
-                    save_ext = ".mp3"
-                elif orig_ext in MEDIA_EXTS:
-                    save_ext = orig_ext
-                else:
-                    save_ext = ".png"
-                if seed:
-                    # With seed: prefix_seed_001.ext
-                    seed_key = seed
-                    if seed_key not in seed_counters:
-                        seed_counters[seed_key] = len(list(save_dir.glob(f"{prefix}_{seed}_*{save_ext}")))
-                    seed_counters[seed_key] += 1
-                    new_name = f"{prefix}_{seed}_{seed_counters[seed_key]:03d}{save_ext}"
-                else:
-                    # No seed: use original ComfyUI filename
-                    orig_stem = Path(filename).stem
-                    new_name = f"{prefix}_{orig_stem}{save_ext}"
-                dst_path = save_dir / new_name
-                copy_with_metadata(src_path, dst_path, seed)
-                count += 1
-
-        return web.json_response({"success": True, "count": count, "folder": str(save_dir)})
 
-    except Exception as e:
-        return web.json_response({"success": False, "error": str(e)})
+async def read_limited(stream, limit):
+    """Read an aiohttp body stream or multipart part in chunks, up to limit bytes."""
+    # Multipart parts have read_chunk(); the request body StreamReader has readany()
+    read = getattr(stream, "read_chunk", None) or stream.readany
+    chunks = []
+    size = 0
+    while True:
+        chunk = await read()
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > limit:
+            raise ValueError(f"Upload larger than {limit // (1024 * 1024)} MB")
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 
-# Screenshot upload endpoint — stores base64 PNG for IMAGE output
+# Screenshot upload endpoint — decodes the image once and stores it as the node's IMAGE output
 @PromptServer.instance.routes.post("/vewd/screenshot")
 async def upload_screenshot(request):
+    """Accepts a raw image body (node_id in the query string), multipart with
+    "image" and "node_id" fields, or the legacy JSON {"image": dataURL, "node_id"}."""
     try:
-        data = await request.json()
-        image_data = data.get("image", "")
-        node_id = data.get("node_id", "default")
+        node_id = request.query.get("node_id", "default")
+        if request.content_type == "application/json":
+            data = await request.json()
+            image_data = data.get("image", "")
+            node_id = data.get("node_id", node_id)
+            # Strip data URL prefix
+            if "," in image_data:
+                image_data = image_data.split(",", 1)[1]
+            img_bytes = base64.b64decode(image_data)
+        elif request.content_type.startswith("multipart/"):
+            img_bytes = b""
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == "node_id":
+                    node_id = await part.text()
+                elif part.name == "image":
+                    img_bytes = await read_limited(part, MAX_SCREENSHOT_BYTES)
+        else:
+            img_bytes = await read_limited(request.content, MAX_SCREENSHOT_BYTES)
 
-        # Strip data URL prefix
-        if "," in image_data:
-            image_data = image_data.split(",", 1)[1]
+        img_tensor = await asyncio.get_running_loop().run_in_executor(_decode_pool, decode_screenshot, img_bytes)
+        with _sessions.edit(str(node_id)) as session:
+            session.screenshot = img_tensor
+            session.screenshot_at = time.monotonic()
+            # Non-video content is now active — clear the video selection for this node
+            select_video(session, None)
 
-        img_bytes = base64.b64decode(image_data)
-        _screenshot_store[node_id] = img_bytes
+        return web.json_response({"success": True})
+    except Exception as e:
+        return web.json_response({"success": False, "error": str(e)})
 
-        # Non-video content is now active — clear video store for this node
-        _video_store.pop(node_id, None)
 
-        return web.json_response({"success": True})
+def media_ref(data):
+    """Selection record for a {filename, subfolder, type} payload, path resolved now."""
+    return {
+        "filename": data.get("filename", ""),
+        "subfolder": data.get("subfolder", ""),
+        "type": data.get("type", "temp"),
+        "path": str(resolve_media_path(data.get("type", "temp"), data.get("subfolder", ""), data.get("filename", ""))),
+    }
+
+
+def resolve_batch_items(items):
+    """Resolve each batch item's path now so decoding can start before the prompt is queued.
+    Any client-supplied "path" is discarded; only resolved, contained paths are kept."""
+    for item in items:
+        item.pop("path", None)
+        if item.get("filename"):
+            item["path"] = str(resolve_media_path(item.get("type", "temp"), item.get("subfolder", ""), item["filename"]))
+    return items
+
+
+def select_batch(session, items):
+    """Set (or with no items, clear) a session's batch selection. Call inside _sessions.edit()."""
+    if not items:
+        session.batch = None
+        cancel_predecode(session, "batch")
+        return
+    session.batch = items
+    schedule_predecode(session, "batch", items)
+
+
+def select_video(session, ref):
+    """Set (or with ref None, clear) a session's video selection. Call inside _sessions.edit()."""
+    session.video = ref
+    if ref is None:
+        cancel_predecode(session, "video")
+    # A batch selection takes priority in process() and is already pre-decoding
+    elif session.batch is None and HAS_VIDEO_DECODER and Path(ref["path"]).exists():
+        schedule_predecode(session, "video", Path(ref["path"]))
+
+
+def select_image(session, ref):
+    """Set (or with ref None, clear) a session's image selection. Call inside _sessions.edit()."""
+    session.image = ref
+    if ref is None:
+        cancel_predecode(session, "image")
+        return
+    # Image selected — clear the video selection for this node
+    select_video(session, None)
+    if session.batch is None and Path(ref["path"]).exists():
+        schedule_predecode(session, "image", Path(ref["path"]))
+
+
+# Selection sync endpoint — applies every Vewd node's selection in one request
+@PromptServer.instance.routes.post("/vewd/sync")
+async def sync_selection(request):
+    """Body: {"nodes": [{"node_id", "items": [batch items], "focus": {media_type,
+    filename, subfolder, type} or null}]}. Paths are resolved first, then every
+    node is updated under one store lock so process() never sees a partial sync."""
+    try:
+        data = await request.json()
+        updates = []
+        for node in data.get("nodes", []):
+            node_id = str(node.get("node_id", ""))
+            if not node_id:
+                return web.json_response({"success": False, "error": "Missing node_id"})
+            focus = node.get("focus") or {}
+            ref = media_ref(focus) if focus.get("filename") else None
+            updates.append((node_id, resolve_batch_items(node.get("items", [])), focus.get("media_type"), ref))
+
+        with _sessions.locked():
+            for node_id, items, media_type, ref in updates:
+                with _sessions.edit(node_id) as session:
+                    select_batch(session, items)
+                    if media_type == "video":
+                        select_video(session, ref)
+                    elif media_type == "image":
+                        select_image(session, ref)
+        return web.json_response({"success": True, "nodes": len(updates)})
     except Exception as e:
         return web.json_response({"success": False, "error": str(e)})
 
@@ -489,11 +2037,10 @@ async def set_batch(request):
         if not node_id:
             return web.json_response({"success": False, "error": "Missing node_id"})
 
+        with _sessions.edit(node_id) as session:
+            select_batch(session, resolve_batch_items(items))
         if not items:
-            _batch_store.pop(node_id, None)
             return web.json_response({"success": True, "cleared": True})
-
-        _batch_store[node_id] = items
         return web.json_response({"success": True, "count": len(items)})
     except Exception as e:
         return web.json_response({"success": False, "error": str(e)})
@@ -505,22 +2052,15 @@ async def set_video(request):
     try:
         data = await request.json()
         node_id = str(data.get("node_id", ""))
-        filename = data.get("filename", "")
 
         if not node_id:
             return web.json_response({"success": False, "error": "Missing node_id"})
 
-        if not filename:
-            # Clear video info for this node
-            _video_store.pop(node_id, None)
+        ref = media_ref(data) if data.get("filename") else None
+        with _sessions.edit(node_id) as session:
+            select_video(session, ref)
+        if ref is None:
             return web.json_response({"success": True, "cleared": True})
-
-        _video_store[node_id] = {
-            "filename": filename,
-            "subfolder": data.get("subfolder", ""),
-            "type": data.get("type", "temp"),
-        }
-
         return web.json_response({"success": True})
     except Exception as e:
         return web.json_response({"success": False, "error": str(e)})
@@ -532,24 +2072,15 @@ async def set_image(request):
     try:
         data = await request.json()
         node_id = str(data.get("node_id", ""))
-        filename = data.get("filename", "")
 
         if not node_id:
             return web.json_response({"success": False, "error": "Missing node_id"})
 
-        if not filename:
-            _image_store.pop(node_id, None)
+        ref = media_ref(data) if data.get("filename") else None
+        with _sessions.edit(node_id) as session:
+            select_image(session, ref)
+        if ref is None:
             return web.json_response({"success": True, "cleared": True})
-
-        _image_store[node_id] = {
-            "filename": filename,
-            "subfolder": data.get("subfolder", ""),
-            "type": data.get("type", "temp"),
-        }
-
-        # Image selected — clear video store for this node
-        _video_store.pop(node_id, None)
-
         return web.json_response({"success": True})
     except Exception as e:
         return web.json_response({"success": False, "error": str(e)})
@@ -567,155 +2098,804 @@ WAVEFORM_COLORS = [
 ]
 
 
-def generate_waveform(audio_path, width=256, height=256):
-    """Generate a waveform thumbnail image from an audio file.
-    Uses ffmpeg to decode to raw PCM, then draws the waveform.
+class PeakAccumulator:
+    """Running per-bin min/max over a stream of int16 samples in at most max_bins bins.
+    When the bins fill up, adjacent pairs merge and the bin size doubles, so memory
+    stays constant however long the audio is."""
+
+    def __init__(self, max_bins=4096, bin_size=16):
+        self.max_bins = max_bins - max_bins % 2
+        self.bin_size = bin_size
+        self.count = 0
+        self.total_samples = 0
+        self.mins = np.empty(self.max_bins, dtype=np.int16)
+        self.maxs = np.empty(self.max_bins, dtype=np.int16)
+        self._pending = np.empty(0, dtype=np.int16)
+
+    def _halve(self):
+        half = self.count // 2
+        np.minimum(self.mins[0:self.count:2], self.mins[1:self.count:2], out=self.mins[:half])
+        np.maximum(self.maxs[0:self.count:2], self.maxs[1:self.count:2], out=self.maxs[:half])
+        self.count = half
+        self.bin_size *= 2
+
+    def add(self, samples):
+        self.total_samples += samples.size
+        if self._pending.size:
+            samples = np.concatenate((self._pending, samples))
+        start = 0
+        while True:
+            if self.count == self.max_bins:
+                self._halve()
+            full = min((samples.size - start) // self.bin_size, self.max_bins - self.count)
+            if full <= 0:
+                break
+            block = samples[start:start + full * self.bin_size].reshape(full, self.bin_size)
+            np.min(block, axis=1, out=self.mins[self.count:self.count + full])
+            np.max(block, axis=1, out=self.maxs[self.count:self.count + full])
+            self.count += full
+            start += full * self.bin_size
+        self._pending = samples[start:].copy()
+
+    def finish(self):
+        """Flush the partial last bin and return (mins, maxs) as int16 arrays."""
+        if self._pending.size:
+            if self.count == self.max_bins:
+                self._halve()
+            self.mins[self.count] = self._pending.min()
+            self.maxs[self.count] = self._pending.max()
+            self.count += 1
+            self._pending = self._pending[:0]
+        return self.mins[:self.count], self.maxs[:self.count]
+
+
+def stream_pcm_peaks(audio_path, max_bins=4096, sample_rate=22050, stall_timeout=15):
+    """Decode audio to 16-bit mono PCM with ffmpeg and reduce it to min/max peaks
+    as it streams, without buffering the decoded audio. A watchdog kills ffmpeg if
+    it produces no output for stall_timeout seconds (e.g. a hung network read),
+    however long the whole decode takes. Returns (mins, maxs, total_samples) or None."""
+    proc = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-nostdin", "-i", str(audio_path), "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    watchdog = StallWatchdog(proc, stall_timeout)
+    peaks = PeakAccumulator(max_bins)
+    carry = b""
+    try:
+        while True:
+            # read1 returns whatever is available, so progress is seen as it happens
+            chunk = proc.stdout.read1(1 << 18)
+            if not chunk:
+                break
+            watchdog.touch()
+            if carry:
+                chunk = carry + chunk
+            usable = len(chunk) & ~1  # keep a split sample for the next read
+            carry = chunk[usable:]
+            if usable:
+                peaks.add(np.frombuffer(chunk, dtype="<i2", count=usable // 2))
+    finally:
+        watchdog.stop()
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+    if watchdog.stalled.is_set():
+        raise TimeoutError(f"Waveform decode stalled for {stall_timeout}s: {audio_path}")
+    if proc.returncode != 0 or peaks.total_samples == 0:
+        return None
+    return peaks.finish() + (peaks.total_samples,)
+
+
+def generate_waveform(levels, filename, width=256, height=256):
+    """Render a waveform thumbnail from peak pyramid levels (see build_peak_pyramid),
+    so it shares the pyramid's single decode. Uses the coarsest level with a bin
+    per pixel column, then renders every column in one vectorized pass.
     Color is deterministic per filename for consistency."""
     try:
-        import subprocess
-        # Decode audio to raw 16-bit mono PCM via ffmpeg
-        result = subprocess.run(
-            ["ffmpeg", "-i", str(audio_path), "-f", "s16le", "-ac", "1", "-ar", "22050", "-"],
-            capture_output=True, timeout=15
-        )
-        if result.returncode != 0:
-            return None
-        raw = result.stdout
-        if len(raw) < 4:
-            return None
-        # Parse PCM samples
-        n_samples = len(raw) // 2
-        samples = np.array(struct.unpack(f"<{n_samples}h", raw[:n_samples * 2]), dtype=np.float32)
+        fitting = [level for level in levels if len(level) >= width]
+        level = fitting[-1] if fitting else levels[0]
+        mins, maxs = level[:, 0], level[:, 1]
+        # Exactly one peak bin per pixel column: merge bins when there are more,
+        # stretch them across columns when a short clip has fewer
+        starts = (np.arange(width) * len(mins)) // width
+        if len(mins) > width:
+            mins = np.minimum.reduceat(mins, starts)
+            maxs = np.maximum.reduceat(maxs, starts)
+        elif len(mins) < width:
+            mins = mins[starts]
+            maxs = maxs[starts]
         # Normalize
-        peak = np.max(np.abs(samples)) or 1.0
-        samples = samples / peak
-        # Downsample to width bins
-        bin_size = max(1, len(samples) // width)
-        bins = len(samples) // bin_size
-        trimmed = samples[:bins * bin_size].reshape(bins, bin_size)
-        maxes = np.max(trimmed, axis=1)
-        mins = np.min(trimmed, axis=1)
+        mins = mins.astype(np.float32)
+        maxs = maxs.astype(np.float32)
+        peak = max(float(np.max(np.abs(mins))), float(np.max(np.abs(maxs)))) or 1.0
+        mins /= peak
+        maxs /= peak
         # Pick color based on filename hash
-        color = WAVEFORM_COLORS[hash(audio_path.name) % len(WAVEFORM_COLORS)]
-        # Draw
-        img = Image.new("RGB", (width, height), (17, 17, 17))
-        draw = ImageDraw.Draw(img)
+        color = WAVEFORM_COLORS[hash(filename) % len(WAVEFORM_COLORS)]
+        # Draw: fill each column between its max and min in one boolean mask
         mid = height // 2
-        for x in range(min(bins, width)):
-            y_top = int(mid - maxes[x] * mid * 0.75)
-            y_bot = int(mid - mins[x] * mid * 0.75)
-            draw.line([(x, y_top), (x, y_bot)], fill=color)
+        y_top = (mid - maxs * mid * 0.75).astype(np.int32)
+        y_bot = (mid - mins * mid * 0.75).astype(np.int32)
+        rows = np.arange(height, dtype=np.int32)[:, None]
+        pixels = np.full((height, width, 3), 17, dtype=np.uint8)
+        pixels[(rows >= y_top) & (rows <= y_bot)] = color
         # Center line
-        draw.line([(0, mid), (width - 1, mid)], fill=(40, 40, 40))
-        return img
+        pixels[mid, :] = (40, 40, 40)
+        return Image.fromarray(pixels, "RGB")
     except Exception as e:
         print(f"[Vewd] Waveform generation failed: {e}")
         return None
 
 
+def find_source_file(filename, subfolder, source_type):
+    """Resolve a source file, trying the alternate temp/output location if it moved.
+    None if it is missing or outside the ComfyUI directories."""
+    try:
+        path = resolve_media_path(source_type, subfolder, filename)
+        if not path.exists():
+            alt_type = "output" if source_type == "temp" else "temp"
+            path = resolve_media_path(alt_type, subfolder, filename)
+    except ValueError:
+        return None
+    return path if path.exists() else None
+
+
+def file_cache_key(path):
+    """Short hex key for a file version: resolved path + mtime + size."""
+    st = os.stat(path)
+    raw = f"{Path(path).resolve()}:{st.st_mtime_ns}:{st.st_size}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def audio_cache_name(filename, subfolder, source_type):
+    """vewd-cache entry name for the kept copy of a temp audio file."""
+    raw = f"{source_type}:{subfolder}:{filename}"
+    return f"audio/{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]}{Path(filename).suffix.lower()}"
+
+
+def keep_audio_copy(audio_path, filename, subfolder, source_type):
+    """Keep temp audio playable after ComfyUI clears temp/ by linking (or copying)
+    it into vewd-cache. Output files persist on their own and are not copied."""
+    temp_dir = Path(folder_paths.get_temp_directory()).resolve()
+    if temp_dir not in Path(audio_path).resolve().parents:
+        return
+    name = audio_cache_name(filename, subfolder, source_type)
+    version = file_cache_key(audio_path)
+    if (_disk_cache.meta(name) or {}).get("version") == version:
+        return
+    try:
+        dst = _disk_cache.path(name)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        dst.unlink(missing_ok=True)
+        link_or_copy(audio_path, dst, "hardlink")
+        _disk_cache.add(name, {"version": version})
+    except OSError as e:
+        print(f"[Vewd] Audio cache failed: {e}")
+
+
+def locate_audio(filename, subfolder, source_type):
+    """Audio source file, or its vewd-cache copy once the original is gone."""
+    audio_path = find_source_file(filename, subfolder, source_type)
+    if audio_path is not None:
+        keep_audio_copy(audio_path, filename, subfolder, source_type)
+        return audio_path
+    cached = _disk_cache.get(audio_cache_name(filename, subfolder, source_type))
+    return cached if cached is not None and cached.exists() else None
+
+
+PEAK_SAMPLE_RATE = 22050
+PEAK_BASE_BINS = 16384
+PEAK_MIN_BINS = 64
+PEAKS_MAGIC = b"VWPK"
+
+
+def build_peak_pyramid(audio_path):
+    """Decode audio once into min/max peak levels, finest first. Each level halves
+    the previous one. Values are int16 normalized so the loudest peak is full scale.
+    Returns (sample_rate, levels, total_samples) with each level shaped (count, 2)."""
+    result = stream_pcm_peaks(audio_path, max_bins=PEAK_BASE_BINS, sample_rate=PEAK_SAMPLE_RATE)
+    if result is None:
+        return None
+    mins, maxs, total_samples = result
+    peak = max(abs(int(mins.min())), abs(int(maxs.max()))) or 1
+    level = np.stack((mins, maxs), axis=1).astype(np.int32) * 32767 // peak
+    levels = [level.astype(np.int16)]
+    while len(levels[-1]) > PEAK_MIN_BINS:
+        prev = levels[-1]
+        starts = np.arange(0, len(prev), 2)
+        levels.append(np.stack((np.minimum.reduceat(prev[:, 0], starts),
+                                np.maximum.reduceat(prev[:, 1], starts)), axis=1))
+    return PEAK_SAMPLE_RATE, levels, total_samples
+
+
+def quantize_peaks(level, bits):
+    """int16 full-scale peaks as int8 (bits=8) or unchanged."""
+    if bits == 8:
+        return (level.astype(np.int32) * 127 // 32767).astype(np.int8)
+    return level
+
+
+def encode_peak_pyramid(sample_rate, levels, total_samples, bits=16):
+    """Binary peaks: "VWPK", version u8, bits u8, level count u16, sample rate u32,
+    total samples u32, then per level (count u32), then each level's interleaved
+    min/max as little-endian int8 or int16."""
+    header = PEAKS_MAGIC + struct.pack("<BBHII", 1, bits, len(levels), sample_rate, total_samples)
+    header += b"".join(struct.pack("<I", len(level)) for level in levels)
+    body = b"".join(quantize_peaks(level, bits).astype("<i1" if bits == 8 else "<i2").tobytes() for level in levels)
+    return header + body
+
+
+def decode_peak_pyramid(data):
+    """Inverse of encode_peak_pyramid for 16-bit data: (sample_rate, levels, total_samples)."""
+    if data[:4] != PEAKS_MAGIC:
+        raise ValueError("Not a peaks file")
+    _, bits, count, sample_rate, total_samples = struct.unpack_from("<BBHII", data, 4)
+    offset = 16
+    sizes = struct.unpack_from(f"<{count}I", data, offset)
+    offset += 4 * count
+    levels = []
+    for size in sizes:
+        levels.append(np.frombuffer(data, dtype="<i2", count=size * 2, offset=offset).reshape(size, 2))
+        offset += size * 4
+    return sample_rate, levels, total_samples
+
+
+def read_cached(name):
+    """Bytes of a vewd-cache entry, or None (dropping the entry if its file vanished)."""
+    cached = _disk_cache.get(name)
+    if cached is None:
+        return None
+    try:
+        return cached.read_bytes()
+    except OSError:
+        _disk_cache.discard(name)
+        return None
+
+
+def load_peak_pyramid(audio_path, cached_only=False):
+    """Peak pyramid for an audio file, from the vewd-cache peaks/ entries or computed
+    and cached. With cached_only, a miss returns None instead of decoding."""
+    name = f"peaks/{file_cache_key(audio_path)}.bin"
+    data = read_cached(name)
+    if data is not None:
+        return decode_peak_pyramid(data)
+    if cached_only:
+        return None
+    built = build_peak_pyramid(audio_path)
+    if built is None:
+        return None
+    sample_rate, levels, total_samples = built
+    _disk_cache.put_bytes(name, encode_peak_pyramid(sample_rate, levels, total_samples))
+    return sample_rate, levels, total_samples
+
+
+def waveform_png(audio_path, pyramid=None, cached_only=False):
+    """800x200 waveform PNG bytes for an audio file, cached per file version and
+    rendered from its peak pyramid (pass it in, or it is loaded via load_peak_pyramid).
+    With cached_only, a miss returns None instead of decoding."""
+    name = f"waveform/{file_cache_key(audio_path)}.png"
+    data = read_cached(name)
+    if data is not None or cached_only:
+        return data
+    pyramid = pyramid or load_peak_pyramid(audio_path)
+    if pyramid is None:
+        return None
+    img = generate_waveform(pyramid[1], audio_path.name, width=800, height=200)
+    if img is None:
+        return None
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    data = buf.getvalue()
+    _disk_cache.put_bytes(name, data)
+    return data
+
+
+def http_validators(path, *params):
+    """Response headers for a body derived from `path` (and request params):
+    a strong ETag from its file-version key, Last-Modified, and no-cache so the
+    browser revalidates instead of re-downloading."""
+    etag = "-".join([file_cache_key(path), *map(str, params)])
+    return {
+        "ETag": f'"{etag}"',
+        "Last-Modified": formatdate(os.stat(path).st_mtime, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+
+def not_modified(request, headers):
+    """True if the request's If-None-Match (or, without one, If-Modified-Since)
+    shows the client already has the version described by headers."""
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or headers["ETag"] in tags
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+NO_STORE = {"Cache-Control": "no-store"}
+
+
+# Audio decodes for waveforms/peaks run here, at most this many ffmpeg processes at once
+_waveform_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 2), thread_name_prefix="vewd-waveform")
+_inflight_jobs = {}  # (kind, path) -> asyncio future, only touched on the event loop
+
+
+async def run_coalesced(key, fn, *args, pool=None):
+    """Run fn(*args) on pool (default _waveform_pool); concurrent callers with
+    the same key share one run instead of each starting their own."""
+    future = _inflight_jobs.get(key)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(pool or _waveform_pool, fn, *args)
+        _inflight_jobs[key] = future
+        future.add_done_callback(lambda _: _inflight_jobs.pop(key, None))
+    # Shielded so one client disconnecting doesn't fail the others waiting on it
+    return await asyncio.shield(future)
+
+
+async def cached_or_coalesced(key, fn, *args, pool=None):
+    """fn(*args, cached_only=True) on the default executor, so cache reads (and the
+    index's first load) stay off the event loop without queueing behind renders;
+    on a miss, a coalesced fn(*args) on pool."""
+    data = await asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, cached_only=True))
+    if data is not None:
+        return data
+    return await run_coalesced(key, fn, *args, pool=pool)
+
+
+async def locate_audio_async(request):
+    """locate_audio for a request's filename/subfolder/type, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(
+        None, locate_audio, request.query.get("filename", ""),
+        request.query.get("subfolder", ""), request.query.get("type", "temp")
+    )
+
+
+@PromptServer.instance.routes.get("/vewd/peaks")
+async def get_peaks(request):
+    """Return min/max waveform peaks for an audio file at several zoom levels.
+    format=bin (default) is the compact encode_peak_pyramid layout, bits=8 or 16;
+    format=json returns the same levels as lists. width=N returns only the
+    coarsest level with at least N bins, so clients can draw any width."""
+    try:
+        if not request.query.get("filename", ""):
+            return web.json_response({"error": "Missing filename"}, status=400)
+        audio_path = await locate_audio_async(request)
+        if audio_path is None:
+            return web.json_response({"error": "File not found"}, status=404)
+
+        width = int(request.query.get("width", 0) or 0)
+        bits = 8 if request.query.get("bits") == "8" else 16
+        fmt = "json" if request.query.get("format") == "json" else "bin"
+        headers = http_validators(audio_path, "peaks", fmt, bits, width)
+        if not_modified(request, headers):
+            return web.Response(status=304, headers=headers)
+
+        pyramid = await cached_or_coalesced(("peaks", str(audio_path)), load_peak_pyramid, audio_path)
+        if pyramid is None:
+            return web.json_response({"error": "Peak extraction failed"}, status=500)
+        sample_rate, levels, total_samples = pyramid
+
+        if width > 0:
+            fitting = [level for level in levels if len(level) >= width]
+            levels = [fitting[-1] if fitting else levels[0]]
+
+        if fmt == "json":
+            return web.json_response({
+                "sample_rate": sample_rate,
+                "total_samples": total_samples,
+                "bits": bits,
+                "levels": [quantize_peaks(level, bits).ravel().tolist() for level in levels],
+            }, headers=headers)
+        return web.Response(body=encode_peak_pyramid(sample_rate, levels, total_samples, bits),
+                            content_type="application/octet-stream", headers=headers)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
 @PromptServer.instance.routes.get("/vewd/waveform")
 async def get_waveform(request):
-    """Generate and return a waveform thumbnail for an audio file.
-    Caches the result in output/vewd-cache/ for persistence across restarts."""
+    """Generate and return a waveform thumbnail for an audio file, drawn from the
+    same cached peak pyramid as /vewd/peaks. Cached in vewd-cache per file version,
+    so it persists across restarts."""
     try:
-        filename = request.query.get("filename", "")
-        subfolder = request.query.get("subfolder", "")
-        source_type = request.query.get("type", "temp")
+        if not request.query.get("filename", ""):
+            return web.json_response({"error": "Missing filename"}, status=400)
 
+        audio_path = await locate_audio_async(request)
+        if audio_path is None:
+            return web.json_response({"error": "File not found"}, status=404)
+
+        headers = http_validators(audio_path, "waveform")
+        if not_modified(request, headers):
+            return web.Response(status=304, headers=headers)
+
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, lambda: waveform_png(audio_path, cached_only=True))
+        if data is None:
+            # Join /vewd/peaks' decode (same key) rather than decoding the file again
+            pyramid = await cached_or_coalesced(("peaks", str(audio_path)), load_peak_pyramid, audio_path)
+            if pyramid is not None:
+                data = await run_coalesced(("waveform", str(audio_path)), waveform_png, audio_path, pyramid)
+        if data is None:
+            return web.json_response({"error": "Waveform generation failed"}, status=500)
+        return web.Response(body=data, content_type="image/png", headers=headers)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@PromptServer.instance.routes.get("/vewd/audio")
+async def get_audio(request):
+    """Serve an audio file for playback, from its vewd-cache copy if temp was cleared."""
+    if not request.query.get("filename", ""):
+        return web.json_response({"error": "Missing filename"}, status=400)
+    audio_path = await locate_audio_async(request)
+    if audio_path is None:
+        return web.json_response({"error": "File not found"}, status=404)
+    # FileResponse sets its own ETag/Last-Modified and answers 304s and Range requests
+    return web.FileResponse(audio_path, headers={"Cache-Control": "no-cache"})
+
+
+THUMB_SIZES = (128, 256, 384, 512, 768, 1024)
+THUMB_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+_thumb_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 2), thread_name_prefix="vewd-thumb")
+
+
+def thumb_size(requested):
+    """Round a requested thumbnail size up to a cached bucket."""
+    return next((size for size in THUMB_SIZES if size >= requested), THUMB_SIZES[-1])
+
+
+def make_thumbnail(img_path, size, fmt="webp"):
+    """Encoded thumbnail bytes, longest side at most `size`. JPEGs decode at a
+    reduced DCT scale via draft(); other formats shrink with reduce() first
+    (thumbnail's reducing_gap) before the final LANCZOS pass. The opened image is
+    shrunk in place and only the small result is transposed and converted, so the
+    full-resolution pixels exist once."""
+    with Image.open(img_path) as img:
+        img.draft("RGB", (size, size))
+        keep_alpha = fmt == "webp" and image_has_alpha(img)
+        if img.mode not in ("RGB", "RGBA", "L", "LA"):
+            # Palette and 16-bit images cannot be resampled with LANCZOS as they are
+            img = img.convert("RGBA" if keep_alpha else "RGB")
+        img.thumbnail((size, size), Image.LANCZOS, reducing_gap=2.0)
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGBA" if keep_alpha else "RGB")
+        buf = io.BytesIO()
+        img.save(buf, format=THUMB_FORMATS[fmt][0], quality=82)
+        return buf.getvalue()
+
+
+def cached_thumbnail(img_path, size, fmt, cached_only=False):
+    """Thumbnail bytes from the vewd-cache thumbs/ entries (keyed by path, mtime,
+    size and thumbnail size) or made and cached. With cached_only, a miss returns None."""
+    name = f"thumbs/{file_cache_key(img_path)}-{size}.{fmt}"
+    data = read_cached(name)
+    if data is not None or cached_only:
+        return data
+    data = make_thumbnail(img_path, size, fmt)
+    _disk_cache.put_bytes(name, data)
+    return data
+
+
+@PromptServer.instance.routes.get("/vewd/thumb")
+async def get_thumb(request):
+    """Downscaled thumbnail of an image for the grid.
+    size=N (default 256, rounded up to THUMB_SIZES), format=webp (default) or jpeg.
+    Animated WebP and APNG sources are served as-is so their grid tiles keep animating."""
+    try:
+        filename = request.query.get("filename", "")
         if not filename:
             return web.json_response({"error": "Missing filename"}, status=400)
+        if Path(filename).suffix.lower() not in IMAGE_EXTS:
+            return web.json_response({"error": "Not an image"}, status=400)
+        try:
+            size = thumb_size(int(request.query.get("size", 256) or 256))
+        except ValueError:
+            return web.json_response({"error": "size must be an integer"}, status=400)
+        fmt = request.query.get("format", "webp")
+        if fmt not in THUMB_FORMATS:
+            return web.json_response({"error": "Unknown format"}, status=400)
+
+        loop = asyncio.get_running_loop()
+        img_path = await loop.run_in_executor(None, find_source_file, filename,
+                                              request.query.get("subfolder", ""), request.query.get("type", "temp"))
+        if img_path is None:
+            return web.json_response({"error": "File not found"}, status=404)
+        if img_path.suffix.lower() in (".webp", ".png") and (await loop.run_in_executor(None, probe_image, img_path))[3] > 1:
+            return web.FileResponse(img_path)
 
-        # Check cache first
-        cache_dir = Path(folder_paths.get_output_directory()) / "vewd-cache"
-        cache_name = Path(filename).stem + "_waveform.png"
-        cache_path = cache_dir / cache_name
+        headers = http_validators(img_path, "thumb", size, fmt)
+        if not_modified(request, headers):
+            return web.Response(status=304, headers=headers)
 
-        if cache_path.exists():
-            return web.Response(body=cache_path.read_bytes(), content_type="image/png")
+        data = await cached_or_coalesced(("thumb", str(img_path), size, fmt), cached_thumbnail,
+                                         img_path, size, fmt, pool=_thumb_pool)
+        return web.Response(body=data, content_type=THUMB_FORMATS[fmt][1], headers=headers)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
 
-        # Find source audio
-        type_dirs = {
-            "temp": folder_paths.get_temp_directory(),
-            "output": folder_paths.get_output_directory(),
-            "input": folder_paths.get_input_directory(),
-        }
-        base_dir = type_dirs.get(source_type, folder_paths.get_temp_directory())
-        audio_path = Path(base_dir) / subfolder / filename if subfolder else Path(base_dir) / filename
 
-        if not audio_path.exists():
-            # Try alternate location
-            alt_type = "output" if source_type == "temp" else "temp"
-            alt_dir = type_dirs.get(alt_type, folder_paths.get_temp_directory())
-            audio_path = Path(alt_dir) / subfolder / filename if subfolder else Path(alt_dir) / filename
+MAX_FILMSTRIP_FRAMES = 32
 
-        if not audio_path.exists():
-            return web.json_response({"error": "File not found"}, status=404)
 
-        img = generate_waveform(audio_path, width=800, height=200)
-        if img is None:
-            return web.json_response({"error": "Waveform generation failed"}, status=500)
+def video_sample_times(duration, count):
+    """Seconds to sample: with count 1 the poster frame, 0.1 s in as the grid used
+    to seek; otherwise the middle of each of count equal spans, for hover scrubbing."""
+    if count == 1:
+        return [min(0.1, duration / 2)]
+    return [(i + 0.5) * duration / count for i in range(count)]
 
-        # Save to cache
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        img.save(cache_path, format="PNG")
 
-        # Also cache the source audio file for playback after temp is cleared
-        audio_cache_path = cache_dir / Path(filename).name
-        if not audio_cache_path.exists():
-            try:
-                shutil.copy2(audio_path, audio_cache_path)
-            except Exception as e:
-                print(f"[Vewd] Audio cache failed: {e}")
+def sample_video_frames_cv2(video_path, count, max_side):
+    """RGB uint8 frames at video_sample_times, seeking with OpenCV per frame."""
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {video_path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if fps <= 0 or total <= 0:
+            raise RuntimeError(f"Unknown frame count: {video_path}")
+        frames = []
+        for t in video_sample_times(total / fps, count):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, min(total - 1, int(t * fps)))
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            w, h = scaled_size(frame.shape[1], frame.shape[0], max_side)
+            if (w, h) != (frame.shape[1], frame.shape[0]):
+                frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+            frames.append(frame)
+        return frames
+    finally:
+        cap.release()
+
+
+def sample_video_frames_ffmpeg(video_path, count, max_side):
+    """RGB uint8 frames at video_sample_times, one fast-seeking ffmpeg run per frame."""
+    width, height, fps, total = probe_video(video_path)
+    if fps <= 0 or total <= 0:
+        raise RuntimeError(f"Unknown duration: {video_path}")
+    w, h = scaled_size(width, height, max_side)
+    frames = []
+    for t in video_sample_times(total / fps, count):
+        result = subprocess.run(
+            ["ffmpeg", "-v", "error", "-noautorotate", "-ss", f"{t:.3f}", "-i", str(video_path),
+             "-frames:v", "1", "-vf", f"scale={w}:{h}:flags=area",
+             "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"],
+            capture_output=True, timeout=30
+        )
+        if result.returncode != 0 or len(result.stdout) < w * h * 3:
+            break
+        frames.append(np.frombuffer(result.stdout, dtype=np.uint8, count=w * h * 3).reshape(h, w, 3))
+    return frames
+
 
-        return web.Response(body=cache_path.read_bytes(), content_type="image/png")
+def video_preview(video_path, size, count):
+    """JPEG bytes of a poster frame (count 1) or a horizontal sprite sheet of count
+    frames, each fitting size x size. cv2 seeking when available, else ffmpeg."""
+    frames = []
+    if HAS_CV2:
+        try:
+            frames = sample_video_frames_cv2(video_path, count, size)
+        except Exception as e:
+            print(f"[Vewd] cv2 preview failed, trying ffmpeg: {e}")
+    if not frames and HAS_FFMPEG:
+        frames = sample_video_frames_ffmpeg(video_path, count, size)
+    if not frames:
+        raise RuntimeError(f"No frames decoded from: {video_path}")
+    # Pad short reads (e.g. a truncated file) by repeating the last frame so tiles stay evenly spaced
+    frames += [frames[-1]] * (count - len(frames))
+    sheet = np.concatenate(frames, axis=1)
+    buf = io.BytesIO()
+    Image.fromarray(sheet).save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+
+def cached_video_preview(video_path, size, count, cached_only=False):
+    """video_preview bytes from the vewd-cache previews/ entries, or made and cached.
+    With cached_only, a miss returns None."""
+    name = f"previews/{file_cache_key(video_path)}-{size}-{count}.jpg"
+    data = read_cached(name)
+    if data is not None or cached_only:
+        return data
+    data = video_preview(video_path, size, count)
+    _disk_cache.put_bytes(name, data)
+    return data
+
+
+async def serve_video_preview(request, filmstrip=False):
+    """Shared handler for /vewd/poster (one frame) and /vewd/filmstrip (frames=N)."""
+    try:
+        filename = request.query.get("filename", "")
+        if not filename:
+            return web.json_response({"error": "Missing filename"}, status=400)
+        try:
+            size = thumb_size(int(request.query.get("size", 256) or 256))
+            count = max(2, min(MAX_FILMSTRIP_FRAMES, int(request.query.get("frames", 10) or 10))) if filmstrip else 1
+        except ValueError:
+            return web.json_response({"error": "size and frames must be integers"}, status=400)
+        if not HAS_VIDEO_DECODER:
+            return web.json_response({"error": "No video decoder (cv2 or ffmpeg) available"}, status=501)
+
+        loop = asyncio.get_running_loop()
+        video_path = await loop.run_in_executor(None, find_source_file, filename,
+                                                request.query.get("subfolder", ""), request.query.get("type", "temp"))
+        if video_path is None:
+            return web.json_response({"error": "File not found"}, status=404)
+
+        headers = http_validators(video_path, "preview", size, count)
+        if not_modified(request, headers):
+            return web.Response(status=304, headers=headers)
+
+        data = await cached_or_coalesced(("preview", str(video_path), size, count), cached_video_preview,
+                                         video_path, size, count, pool=_thumb_pool)
+        return web.Response(body=data, content_type="image/jpeg", headers=headers)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
 
+@PromptServer.instance.routes.get("/vewd/poster")
+async def get_poster(request):
+    """Poster frame of a video as JPEG, longest side at most size (default 256)."""
+    return await serve_video_preview(request)
+
+
+@PromptServer.instance.routes.get("/vewd/filmstrip")
+async def get_filmstrip(request):
+    """Horizontal JPEG sprite sheet of frames=N (default 10) evenly spaced video
+    frames, each at most size x size, for scrubbing a grid tile on hover."""
+    return await serve_video_preview(request, filmstrip=True)
+
+
+FIND_KINDS = {
+    "audio": {'.mp3', '.wav', '.ogg', '.flac', '.aac'},
+    "video": {'.mp4', '.webm', '.mov', '.avi', '.mkv'},
+    "image": set(IMAGE_EXTS),
+    "model": BINARY_EXTS,
+}
+EXT_KINDS = {ext: kind for kind, exts in FIND_KINDS.items() for ext in exts}
+
+
+class DirIndex:
+    """Media files in one directory, newest first, from os.scandir. refresh() only
+    rescans when the directory mtime changed, and then only stats entries that are
+    new or whose inode changed. Lookups per (prefix, kinds) are memoized until the
+    next change."""
+
+    # A directory modified this recently may change again within its mtime granularity
+    RACY_SECONDS = 2.0
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime_ns = None
+        self.scanned_at = 0.0
+        self.files = {}    # name -> (mtime, inode)
+        self.newest = []   # [(mtime, name)], newest first
+        self._latest = {}  # (prefix, kinds) -> name or None
+
+    def refresh(self):
+        st = os.stat(self.path)
+        racy = self.scanned_at - st.st_mtime < self.RACY_SECONDS
+        if st.st_mtime_ns == self.mtime_ns and not racy:
+            return
+        self.scanned_at = time.time()
+        files = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if os.path.splitext(entry.name)[1].lower() not in EXT_KINDS:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    known = self.files.get(entry.name)
+                    if known is not None and known[1] == entry.inode():
+                        files[entry.name] = known
+                    else:
+                        files[entry.name] = (entry.stat().st_mtime, entry.inode())
+                except OSError:
+                    continue  # removed while scanning
+        if files != self.files or self.mtime_ns is None:
+            self.files = files
+            self.newest = sorted(((mtime, name) for name, (mtime, _) in files.items()), reverse=True)
+            self._latest = {}
+        self.mtime_ns = st.st_mtime_ns
+
+    def latest(self, prefix, kinds):
+        key = (prefix, kinds)
+        if key not in self._latest:
+            self._latest[key] = next((name for _, name in self.newest if name.startswith(prefix)
+                                      and EXT_KINDS[os.path.splitext(name)[1].lower()] in kinds), None)
+        return self._latest[key]
+
+
+_dir_indexes = {}  # directory path -> DirIndex
+_dir_indexes_lock = threading.Lock()
+
+
+def find_latest_file(prefix, kinds):
+    """Newest output file for a filename_prefix like "ace-step/text2music", as
+    {filename, subfolder, type, media_type}, or None."""
+    output_dir = Path(folder_paths.get_output_directory())
+    # prefix could be "ace-step/text2music" → search in output/ace-step/ for text2music*
+    if "/" in prefix:
+        parts = prefix.rsplit("/", 1)
+        file_prefix = parts[1]
+        try:
+            search_dir = resolve_media_path("output", parts[0], "")
+        except ValueError:
+            return None
+    else:
+        search_dir = output_dir
+        file_prefix = prefix
+    if not search_dir.is_dir():
+        return None
+
+    with _dir_indexes_lock:
+        index = _dir_indexes.get(str(search_dir))
+        if index is None:
+            index = _dir_indexes[str(search_dir)] = DirIndex(search_dir)
+        index.refresh()
+        name = index.latest(file_prefix, kinds)
+    if name is None:
+        return None
+
+    # Return path relative to output dir
+    rel_path = (search_dir / name).relative_to(output_dir)
+    subfolder = str(rel_path.parent) if rel_path.parent != Path(".") else ""
+    return {
+        "filename": name,
+        "subfolder": subfolder.replace("\\", "/"),
+        "type": "output",
+        "media_type": EXT_KINDS[Path(name).suffix.lower()],
+    }
+
+
 @PromptServer.instance.routes.get("/vewd/find_latest")
 async def find_latest(request):
     """Find the latest file matching a prefix in the output directory.
-    Used for nodes like ACE-Step that save files but don't expose them via executed event."""
+    Used for nodes like ACE-Step that save files but don't expose them via executed event.
+    Accepts several prefix= parameters and kind=audio,video,image,model (default: all).
+    "results" maps each prefix to its match or null; with a single prefix the match is
+    also returned at the top level (404 if none)."""
     try:
-        prefix = request.query.get("prefix", "")
-        if not prefix:
+        prefixes = [p for p in request.query.getall("prefix", []) if p]
+        if not prefixes:
             return web.json_response({"error": "Missing prefix"}, status=400)
-
-        output_dir = Path(folder_paths.get_output_directory())
-        # prefix could be "ace-step/text2music" → search in output/ace-step/ for text2music*
-        if "/" in prefix:
-            parts = prefix.rsplit("/", 1)
-            search_dir = output_dir / parts[0]
-            file_prefix = parts[1]
-        else:
-            search_dir = output_dir
-            file_prefix = prefix
-
-        if not search_dir.exists():
-            return web.json_response({"error": "Directory not found"}, status=404)
-
-        # Find newest file matching prefix
-        audio_exts = {'.mp3', '.wav', '.ogg', '.flac', '.aac'}
-        matches = [f for f in search_dir.iterdir()
-                   if f.is_file() and f.name.startswith(file_prefix) and f.suffix.lower() in audio_exts]
-
-        if not matches:
-            return web.json_response({"error": "No matching files"}, status=404)
-
-        latest = max(matches, key=lambda f: f.stat().st_mtime)
-        # Return path relative to output dir
-        rel_path = latest.relative_to(output_dir)
-        subfolder = str(rel_path.parent) if rel_path.parent != Path(".") else ""
-
-        return web.json_response({
-            "filename": latest.name,
-            "subfolder": subfolder.replace("\\", "/"),
-            "type": "output"
-        })
+        kinds = frozenset(k for k in request.query.get("kind", ",".join(FIND_KINDS)).split(",") if k in FIND_KINDS)
+        if not kinds:
+            return web.json_response({"error": "Unknown kind"}, status=400)
+
+        results = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: {prefix: find_latest_file(prefix, kinds) for prefix in prefixes})
+
+        if len(prefixes) == 1:
+            match = results[prefixes[0]]
+            if match is None:
+                return web.json_response({"error": "No matching files", "results": results}, status=404, headers=NO_STORE)
+            return web.json_response({**match, "results": results}, headers=NO_STORE)
+        return web.json_response({"results": results}, headers=NO_STORE)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
 
+@PromptServer.instance.routes.get("/vewd/cache_stats")
+async def cache_stats(request):
+    """Report decoded-media, vewd-cache and per-node session occupancy and counters."""
+    # The disk cache's first use scans its folder, so read it off the event loop
+    disk = await asyncio.get_running_loop().run_in_executor(None, _disk_cache.stats)
+    return web.json_response({"decode": _decode_cache.stats(), "disk": disk,
+                              "sessions": _sessions.stats()}, headers=NO_STORE)
+
+
 NODE_CLASS_MAPPINGS = {
     "Vewd": Vewd,
 }
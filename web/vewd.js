@@ -97,6 +97,7 @@ style.textContent = `
     }
     .vewd-item.hidden { display: none; }
     .vewd-item img, .vewd-item video { width: 100%; height: 100%; object-fit: cover; }
+    .vewd-item .vewd-scrub { position: absolute; inset: 0; display: none; background-repeat: no-repeat; pointer-events: none; }
     .vewd-item .audio-icon, .vewd-item .model-icon, .vewd-item .splat-icon {
         width: 100%;
         height: 100%;
@@ -382,6 +383,114 @@ async function generateWaveformClient(audioUrl, filename, width = 800, height =
         mins[i] = min;
     }
 
+    return drawWaveform(mins, maxes, filename, width, height);
+}
+
+// Fetch server-side min/max peaks (/vewd/peaks, 8-bit binary) reduced to width bins.
+// Avoids downloading and decoding the whole audio file in the browser.
+async function fetchWaveformPeaks(filename, sourceInfo, width = 800) {
+    const url = `/vewd/peaks?filename=${encodeURIComponent(filename)}&subfolder=${encodeURIComponent(sourceInfo?.subfolder || "")}&type=${sourceInfo?.type || "temp"}&format=bin&bits=8&width=${width}`;
+    const response = await api.fetchApi(url);
+    if (!response.ok) throw new Error(`peaks ${response.status}`);
+    const view = new DataView(await response.arrayBuffer());
+    if (view.getUint32(0, false) !== 0x5657504B) throw new Error("bad peaks header"); // "VWPK"
+    const bits = view.getUint8(5);
+    const levels = view.getUint16(6, true);
+    const offset = 16 + levels * 4;
+    // Only the first level is used; width= asks the server for the one that fits
+    const count = view.getUint32(16, true);
+    const scale = bits === 8 ? 127 : 32767;
+    const read = (i) => bits === 8 ? view.getInt8(offset + i) : view.getInt16(offset + i * 2, true);
+
+    const bins = Math.min(count, width);
+    const mins = new Float32Array(bins);
+    const maxes = new Float32Array(bins);
+    for (let x = 0; x < bins; x++) {
+        const start = Math.floor(x * count / bins);
+        const end = Math.max(start + 1, Math.floor((x + 1) * count / bins));
+        let max = -1, min = 1;
+        for (let i = start; i < end; i++) {
+            const lo = read(i * 2) / scale;
+            const hi = read(i * 2 + 1) / scale;
+            if (hi > max) max = hi;
+            if (lo < min) min = lo;
+        }
+        mins[x] = min;
+        maxes[x] = max;
+    }
+    return { mins, maxes };
+}
+
+// Playback URL for audio; locally /vewd/audio falls back to the server's cached copy once temp is cleared
+function audioPlaybackUrl(src, filename, sourceInfo) {
+    if (isCloud) return src;
+    return api.apiURL(`/vewd/audio?filename=${encodeURIComponent(filename)}&subfolder=${encodeURIComponent(sourceInfo?.subfolder || "")}&type=${sourceInfo?.type || "temp"}`);
+}
+
+// Grid tile URL for an image: a server-side thumbnail when local; GIFs keep the original so they animate
+// (the server returns animated WebP/APNG sources unchanged for the same reason).
+// Full resolution is only loaded in the preview pane.
+const THUMB_EXTS = [".png", ".jpg", ".jpeg", ".webp", ".bmp"];
+function thumbUrl(src, filename, sourceInfo) {
+    const lower = filename.toLowerCase();
+    if (isCloud || !sourceInfo || !THUMB_EXTS.some(ext => lower.endsWith(ext))) return src;
+    const size = Math.round(256 * (window.devicePixelRatio || 1));
+    return api.apiURL(`/vewd/thumb?filename=${encodeURIComponent(filename)}&subfolder=${encodeURIComponent(sourceInfo?.subfolder || "")}&type=${sourceInfo?.type || "temp"}&size=${size}`);
+}
+
+// Video tiles: a server-made poster frame, scrubbed on hover over a filmstrip sprite sheet,
+// so the grid never downloads the video streams. Local only; cloud keeps <video> tiles.
+const FILMSTRIP_FRAMES = 10;
+function videoPreviewUrl(route, filename, sourceInfo) {
+    const size = Math.round(256 * (window.devicePixelRatio || 1));
+    const frames = route === "filmstrip" ? `&frames=${FILMSTRIP_FRAMES}` : "";
+    return api.apiURL(`/vewd/${route}?filename=${encodeURIComponent(filename)}&subfolder=${encodeURIComponent(sourceInfo?.subfolder || "")}&type=${sourceInfo?.type || "temp"}&size=${size}${frames}`);
+}
+
+function setupVideoTile(item, filename, sourceInfo, onError) {
+    item.innerHTML = `<img src="${videoPreviewUrl("poster", filename, sourceInfo)}"><div class="vewd-scrub"></div><div class="media-icon">▶</div>`;
+    item.querySelector("img").addEventListener("error", onError, { once: true });
+    const scrub = item.querySelector(".vewd-scrub");
+    let sheet = null;
+    item.addEventListener("mouseenter", () => {
+        if (!scrub.isConnected) return; // replaced by the <video> fallback
+        if (!sheet) {
+            sheet = new Image();
+            sheet.src = videoPreviewUrl("filmstrip", filename, sourceInfo);
+        }
+    });
+    item.addEventListener("mousemove", (e) => {
+        if (!scrub.isConnected || !sheet?.complete || !sheet.naturalWidth) return;
+        const w = item.clientWidth, h = item.clientHeight;
+        const x = e.clientX - item.getBoundingClientRect().left - item.clientLeft;
+        const i = Math.min(FILMSTRIP_FRAMES - 1, Math.max(0, Math.floor(x / w * FILMSTRIP_FRAMES)));
+        // Cover the tile with frame i, like object-fit: cover on the poster
+        const fw = sheet.naturalWidth / FILMSTRIP_FRAMES, fh = sheet.naturalHeight;
+        const scale = Math.max(w / fw, h / fh);
+        scrub.style.backgroundImage = `url("${sheet.src}")`;
+        scrub.style.backgroundSize = `${sheet.naturalWidth * scale}px ${fh * scale}px`;
+        scrub.style.backgroundPosition = `${-(i * fw * scale) - (fw * scale - w) / 2}px ${-(fh * scale - h) / 2}px`;
+        scrub.style.display = "block";
+    });
+    item.addEventListener("mouseleave", () => { scrub.style.display = "none"; });
+}
+
+// Waveform data URL: server peaks when local, client-side decode otherwise or on failure
+async function loadWaveform(audioUrl, filename, sourceInfo, width = 800, height = 200) {
+    if (!isCloud) {
+        try {
+            const { mins, maxes } = await fetchWaveformPeaks(filename, sourceInfo, width);
+            return drawWaveform(mins, maxes, filename, width, height);
+        } catch (e) {
+            // fall through to client-side decode
+        }
+    }
+    return generateWaveformClient(audioUrl, filename, width, height);
+}
+
+function drawWaveform(mins, maxes, filename, width = 800, height = 200) {
+    const bins = mins.length;
+
     // Pick color based on filename hash
     const color = WAVEFORM_COLORS[hashString(filename) % WAVEFORM_COLORS.length];
 
@@ -399,9 +508,11 @@ async function generateWaveformClient(audioUrl, filename, width = 800, height =
     const mid = height / 2;
     ctx.strokeStyle = `rgb(${color[0]}, ${color[1]}, ${color[2]})`;
     ctx.lineWidth = 1;
-    for (let x = 0; x < Math.min(bins, width); x++) {
-        const yTop = Math.round(mid - maxes[x] * mid * 0.75);
-        const yBot = Math.round(mid - mins[x] * mid * 0.75);
+    // Short clips have fewer bins than columns: stretch them across the full width
+    for (let x = 0; x < width; x++) {
+        const i = bins >= width ? x : Math.floor(x * bins / width);
+        const yTop = Math.round(mid - maxes[i] * mid * 0.75);
+        const yBot = Math.round(mid - mins[i] * mid * 0.75);
         ctx.beginPath();
         ctx.moveTo(x, yTop);
         ctx.lineTo(x, yBot);
@@ -518,20 +629,20 @@ function createVewdWidget(node) {
         item.className = "vewd-item";
 
         if (type === "video") {
-            item.innerHTML = `<video src="${src}" muted playsinline preload="auto"></video><div class="media-icon">▶</div>`;
-            const vid = item.querySelector("video");
-            vid.addEventListener("loadeddata", () => { vid.currentTime = 0.1; });
+            const showVideo = () => {
+                item.innerHTML = `<video src="${src}" muted playsinline preload="auto"></video><div class="media-icon">▶</div>`;
+                const vid = item.querySelector("video");
+                vid.addEventListener("loadeddata", () => { vid.currentTime = 0.1; });
+            };
+            // Poster + hover filmstrip from the server; fall back to a <video> tile if it can't make one
+            if (isCloud || !sourceInfo) showVideo();
+            else setupVideoTile(item, filename, sourceInfo, showVideo);
         } else if (type === "audio") {
-            // Generate waveform client-side via Web Audio API
+            // Waveform from server peaks (local) or Web Audio API (cloud)
             item.innerHTML = `<div class="audio-icon">♪</div><audio src="${src}"></audio>`;
-            generateWaveformClient(src, filename).then(dataUrl => {
+            loadWaveform(src, filename, sourceInfo).then(dataUrl => {
                 item.innerHTML = `<img src="${dataUrl}"><div class="media-icon">♪</div><audio src="${src}"></audio>`;
             }).catch(() => {});
-            // Also trigger server-side cache on local (for persistence across restarts)
-            if (!isCloud) {
-                const wfUrl = `/vewd/waveform?filename=${encodeURIComponent(filename)}&subfolder=${encodeURIComponent(sourceInfo?.subfolder || "")}&type=${sourceInfo?.type || "temp"}`;
-                api.fetchApi(wfUrl).catch(() => {});
-            }
         } else if (type === "model") {
             if (thumbnail) {
                 item.innerHTML = `<img src="${thumbnail}"><div class="media-icon">🧊</div>`;
@@ -546,7 +657,7 @@ function createVewdWidget(node) {
             }
         } else {
             const isGif = filename.toLowerCase().endsWith(".gif");
-            item.innerHTML = `<img src="${src}">${isGif ? '<div class="media-icon">▶</div>' : ''}`;
+            item.innerHTML = `<img src="${thumbUrl(src, filename, sourceInfo)}">${isGif ? '<div class="media-icon">▶</div>' : ''}`;
         }
 
         item.ondblclick = (e) => { e.stopPropagation(); toggleFullscreen(); };
@@ -667,8 +778,7 @@ function createVewdWidget(node) {
             if (media.type === "video") {
                 content = `<video src="${media.src}" controls muted loop playsinline preload="auto"></video>`;
             } else if (media.type === "audio") {
-                const baseName = media.filename.split('/').pop().split('\\').pop();
-                const cachedAudioUrl = isCloud ? media.src : api.apiURL(`/view?filename=${encodeURIComponent(baseName)}&subfolder=vewd-cache&type=output&t=${Date.now()}`);
+                const cachedAudioUrl = audioPlaybackUrl(media.src, media.filename, media.sourceInfo);
                 content = `<div class="audio-preview">
                     <div class="waveform-wrap" data-audio-seek>
                         <img src="" style="display:none">
@@ -681,11 +791,11 @@ function createVewdWidget(node) {
                     </div>
                     <audio src="${cachedAudioUrl}" preload="auto"></audio>
                 </div>`;
-                // Generate waveform client-side after render
+                // Generate waveform after render
                 setTimeout(() => {
                     const wfImg = previewArea.querySelector(".waveform-wrap img");
                     if (wfImg) {
-                        generateWaveformClient(media.src, media.filename).then(dataUrl => {
+                        loadWaveform(media.src, media.filename, media.sourceInfo).then(dataUrl => {
                             wfImg.src = dataUrl;
                             wfImg.style.display = "";
                         }).catch(() => {});
@@ -708,21 +818,23 @@ function createVewdWidget(node) {
             // Fetch the source image/video-frame as blob to avoid canvas taint issues
             fetch(media.src)
                 .then(r => r.blob())
-                .then(blob => {
-                    const reader = new FileReader();
-                    reader.onload = () => sendScreenshot(reader.result);
-                    reader.readAsDataURL(blob);
-                })
+                .then(blob => sendScreenshot(blob))
                 .catch(e => console.warn("[Vewd] Preview upload failed:", e));
         }
 
-        function sendScreenshot(dataUrl) {
+        // Upload an image Blob (or data URL) as the raw request body
+        async function sendScreenshot(image) {
             if (isCloud) return;
-            api.fetchApi("/vewd/screenshot", {
-                method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({ image: dataUrl, node_id: String(getNodeId()) })
-            }).catch(e => console.warn("[Vewd] Screenshot upload failed:", e));
+            try {
+                const blob = image instanceof Blob ? image : await (await fetch(image)).blob();
+                await api.fetchApi(`/vewd/screenshot?node_id=${encodeURIComponent(String(getNodeId()))}`, {
+                    method: "POST",
+                    headers: { "Content-Type": blob.type || "image/png" },
+                    body: blob
+                });
+            } catch (e) {
+                console.warn("[Vewd] Screenshot upload failed:", e);
+            }
         }
 
         // Listen for screenshot messages from splat viewer iframe
@@ -956,6 +1068,16 @@ function createVewdWidget(node) {
         persistState();
     }
 
+    // Export/save run as server-side jobs — poll until every file is done
+    async function waitForExportJob(jobId) {
+        while (true) {
+            const res = await api.fetchApi(`/vewd/export_status?job_id=${encodeURIComponent(jobId)}`);
+            const status = await res.json();
+            if (!status.success || status.state === "done") return status;
+            await new Promise(r => setTimeout(r, 300));
+        }
+    }
+
     async function exportSelects() {
         if (isCloud) return;
         const toExport = state.selected.size > 0
@@ -987,10 +1109,17 @@ function createVewdWidget(node) {
                     }))
                 })
             });
-            const data = await res.json();
+            const job = await res.json();
+            if (!job.success) {
+                showToast("Export failed");
+                return;
+            }
+            showToast(`Exporting ${job.total}...`, 60000);
+            const data = await waitForExportJob(job.job_id);
             if (data.success) {
                 showToast(`Exported ${data.count} images`);
                 flashBtn(exportBtn);
+                if (data.debug?.length) console.warn("[Vewd] Export: missing files", data.debug);
             } else {
                 showToast("Export failed");
             }
@@ -1028,7 +1157,12 @@ function createVewdWidget(node) {
                     }))
                 })
             });
-            const data = await res.json();
+            const job = await res.json();
+            if (!job.success) {
+                showToast("Save failed");
+                return;
+            }
+            const data = await waitForExportJob(job.job_id);
             if (data.success) {
                 showToast("SAVED!");
                 flashBtn(saveBtn);
@@ -1281,22 +1415,25 @@ function createVewdWidget(node) {
                 }
 
                 if (saved.type === "video") {
-                    item.innerHTML = `<video src="${src}" muted playsinline preload="auto"></video><div class="media-icon">▶</div>`;
-                    const vid = item.querySelector("video");
-                    vid.addEventListener("loadeddata", () => { vid.currentTime = 0.1; });
-                    vid.addEventListener("error", () => tryFallback(vid, "video"), { once: true });
+                    const showVideo = () => {
+                        item.innerHTML = `<video src="${src}" muted playsinline preload="auto"></video><div class="media-icon">▶</div>`;
+                        const vid = item.querySelector("video");
+                        vid.addEventListener("loadeddata", () => { vid.currentTime = 0.1; });
+                        vid.addEventListener("error", () => tryFallback(vid, "video"), { once: true });
+                    };
+                    // The server resolves moved files itself, so a poster error means no preview could be made
+                    if (isCloud) showVideo();
+                    else setupVideoTile(item, saved.filename, si, showVideo);
                 } else if (saved.type === "audio") {
-                    const baseName = saved.filename.split('/').pop().split('\\').pop();
-                    // Try cached audio copy first (local), fall back to original location
-                    const cachedAudioSrc = isCloud ? src : api.apiURL(`/view?filename=${encodeURIComponent(baseName)}&subfolder=vewd-cache&type=output&t=${Date.now()}`);
+                    // Original location, or the server's cached copy if temp was cleared
+                    const cachedAudioSrc = audioPlaybackUrl(src, saved.filename, si);
                     if (!isCloud) {
-                        // Local: try server-cached waveform first, fall back to client-side
-                        const cacheName = baseName.replace(/\.[^.]+$/, '') + '_waveform.png';
-                        const wfSrc = api.apiURL(`/view?filename=${encodeURIComponent(cacheName)}&subfolder=vewd-cache&type=output&t=${Date.now()}`);
+                        // Local: server waveform (cached per file version), fall back to client-side
+                        const wfSrc = api.apiURL(`/vewd/waveform?filename=${encodeURIComponent(saved.filename)}&subfolder=${encodeURIComponent(si.subfolder || "")}&type=${si.type || "temp"}`);
                         item.innerHTML = `<img src="${wfSrc}"><div class="media-icon">♪</div><audio src="${cachedAudioSrc}"></audio>`;
                         item.querySelector("img").addEventListener("error", () => {
-                            // Server cache miss — generate client-side
-                            generateWaveformClient(cachedAudioSrc, saved.filename).then(dataUrl => {
+                            // Server waveform failed — try peaks, then client-side
+                            loadWaveform(cachedAudioSrc, saved.filename, si).then(dataUrl => {
                                 item.querySelector("img").src = dataUrl;
                             }).catch(() => {
                                 item.querySelector("img").replaceWith(Object.assign(document.createElement("div"), { className: "audio-icon", textContent: "♪" }));
@@ -1317,9 +1454,6 @@ function createVewdWidget(node) {
                             item.appendChild(mediaIcon);
                         }).catch(() => {});
                     }
-                    // If cached audio fails, try original location
-                    const audioEl = item.querySelector("audio");
-                    if (!isCloud) audioEl.addEventListener("error", () => { audioEl.src = src; }, { once: true });
                 } else if (saved.type === "model") {
                     if (saved.thumbnail) {
                         item.innerHTML = `<img src="${saved.thumbnail}"><div class="media-icon">🧊</div>`;
@@ -1334,7 +1468,7 @@ function createVewdWidget(node) {
                     }
                 } else {
                     const isGif = saved.filename.toLowerCase().endsWith(".gif");
-                    item.innerHTML = `<img src="${src}">${isGif ? '<div class="media-icon">▶</div>' : ''}`;
+                    item.innerHTML = `<img src="${thumbUrl(src, saved.filename, si)}">${isGif ? '<div class="media-icon">▶</div>' : ''}`;
                     const img = item.querySelector("img");
                     if (img) img.addEventListener("error", () => tryFallback(img, "img"), { once: true });
                 }
@@ -1467,63 +1601,50 @@ function createVewdWidget(node) {
     });
     el.addEventListener("drop", handleDrop);
 
-    // Sync current selection to backend stores (called before workflow queue)
-    // Sets hidden widget value for cloud-compatible passthrough + HTTP endpoints for local
-    function syncToBackend() {
-        if (state.focusIndex < 0 || !state.images.length) return;
-        const media = state.images[state.focusIndex];
-        if (!media) return;
-
+    // Current selection as sent to the backend / stored in the hidden widget
+    function selectionItems() {
         const sel = [...state.selected].sort((a, b) => a - b);
-        const items = sel.map(i => state.images[i]).filter(Boolean);
-
-        // Send batch selection via HTTP (works on local, synchronous to beat process())
-        if (!isCloud) {
-            try {
-                const xhr = new XMLHttpRequest();
-                xhr.open("POST", "/vewd/set_batch", false);
-                xhr.setRequestHeader("Content-Type", "application/json");
-                xhr.send(JSON.stringify({
-                    node_id: String(getNodeId()),
-                    items: items.map(m => ({
-                        media_type: m.type,
-                        filename: m.filename,
-                        subfolder: m.sourceInfo?.subfolder || "",
-                        type: m.sourceInfo?.type || "temp",
-                    }))
-                }));
-                console.log(`[Vewd] syncToBackend: ${items.length} items sent via batch endpoint`);
-            } catch (e) {
-                console.warn("[Vewd] syncToBackend failed:", e);
-            }
+        return sel.map(i => state.images[i]).filter(Boolean).map(m => ({
+            media_type: m.type,
+            filename: m.filename,
+            subfolder: m.sourceInfo?.subfolder || "",
+            type: m.sourceInfo?.type || "temp",
+        }));
+    }
 
-            // Also set single-item endpoints for backward compat
-            if (media.type === "video") {
-                try {
-                    const xhr = new XMLHttpRequest();
-                    xhr.open("POST", "/vewd/set_video", false);
-                    xhr.setRequestHeader("Content-Type", "application/json");
-                    xhr.send(JSON.stringify({ node_id: String(getNodeId()), filename: media.filename, subfolder: media.sourceInfo?.subfolder || "", type: media.sourceInfo?.type || "temp" }));
-                } catch (e) {}
-            } else if (media.type === "image") {
-                try {
-                    const xhr = new XMLHttpRequest();
-                    xhr.open("POST", "/vewd/set_image", false);
-                    xhr.setRequestHeader("Content-Type", "application/json");
-                    xhr.send(JSON.stringify({ node_id: String(getNodeId()), filename: media.filename, subfolder: media.sourceInfo?.subfolder || "", type: media.sourceInfo?.type || "temp" }));
-                } catch (e) {}
-            }
+    // Set hidden widget value for cloud-compatible passthrough (called before the prompt is serialized)
+    function syncWidget() {
+        if (state.focusIndex < 0 || !state.images.length) return;
+        const hiddenWidgets = syncWidget._hiddenWidgets;
+        if (hiddenWidgets && hiddenWidgets["selected_media"]) {
+            hiddenWidgets["selected_media"].value = JSON.stringify(selectionItems());
         }
+    }
 
-        // Also set hidden widget for cloud passthrough
-        const hiddenWidgets = syncToBackend._hiddenWidgets;
-        if (hiddenWidgets && hiddenWidgets["selected_media"]) {
-            hiddenWidgets["selected_media"].value = JSON.stringify(items.map(m => ({
-                media_type: m.type,
-                filename: m.filename,
-                subfolder: m.sourceInfo?.subfolder || "",
-                type: m.sourceInfo?.type || "temp",
-            })));
+    // Sync current selection to the backend session store in one async request (local only).
+    // The /prompt POST waits on the returned promise so process() sees the new selection.
+    async function syncToBackend() {
+        syncWidget();
+        if (isCloud || state.focusIndex < 0 || !state.images.length) return;
+        const media = state.images[state.focusIndex];
+        if (!media) return;
+
+        const items = selectionItems();
+        const focus = (media.type === "video" || media.type === "image") ? {
+            media_type: media.type,
+            filename: media.filename,
+            subfolder: media.sourceInfo?.subfolder || "",
+            type: media.sourceInfo?.type || "temp",
+        } : null;
+        try {
+            await api.fetchApi("/vewd/sync", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ nodes: [{ node_id: String(getNodeId()), items, focus }] })
+            });
+            console.log(`[Vewd] syncToBackend: ${items.length} items synced`);
+        } catch (e) {
+            console.warn("[Vewd] syncToBackend failed:", e);
         }
     }
 
@@ -1538,7 +1659,7 @@ function createVewdWidget(node) {
         if (hintSpan) hintSpan.textContent = "spacebar ❤ | esc exit";
     }
 
-    return { el, addImage, addMedia, state, autoExportTagged, folderInput, prefixInput, seenImages, restoreState, persistState, syncToBackend };
+    return { el, addImage, addMedia, state, autoExportTagged, folderInput, prefixInput, seenImages, restoreState, persistState, syncWidget, syncToBackend };
 }
 
 // Global widget reference
@@ -1550,7 +1671,7 @@ app.registerExtension({
 
     // Sync widget values BEFORE ComfyUI serializes the prompt
     async beforeQueuePrompt() {
-        if (globalVewdWidget) globalVewdWidget.syncToBackend();
+        if (globalVewdWidget) globalVewdWidget.syncWidget();
     },
 
     async setup() {
@@ -1565,8 +1686,10 @@ app.registerExtension({
                     const body = JSON.parse(options.body);
                     if (body.prompt) lastPromptData = body.prompt;
                 } catch (e) {}
-                // Sync HTTP endpoints (local only — widget already set above)
-                if (globalVewdWidget) globalVewdWidget.syncToBackend();
+                // Sync the selection (local only — widget already set above), then send the prompt
+                if (globalVewdWidget) {
+                    return globalVewdWidget.syncToBackend().then(() => origFetchApi(url, options, ...rest));
+                }
             }
             return origFetchApi(url, options, ...rest);
         };
@@ -1701,7 +1824,7 @@ app.registerExtension({
                     const nodeData = lastPromptData[String(detail.node)];
                     const prefix = nodeData?.inputs?.filename_prefix;
                     if (prefix) {
-                        api.fetchApi(`/vewd/find_latest?prefix=${encodeURIComponent(prefix)}`).then(r => r.json()).then(info => {
+                        api.fetchApi(`/vewd/find_latest?prefix=${encodeURIComponent(prefix)}&kind=audio`).then(r => r.json()).then(info => {
                             if (info.filename) {
                                 addOutput(info, "audio");
                             }
@@ -1801,8 +1924,8 @@ app.registerExtension({
                 }
             }
         }
-        // Attach hiddenWidgets to syncToBackend so it can access selected_media
-        widget.syncToBackend._hiddenWidgets = hiddenWidgets;
+        // Attach hiddenWidgets to syncWidget so it can access selected_media
+        widget.syncWidget._hiddenWidgets = hiddenWidgets;
 
         // Persist folder/prefix via localStorage (keyed per node ID)
         const storageKey = `vewd_${node.id}`;